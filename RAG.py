@@ -3,8 +3,10 @@ from typing import List, Dict, Any, Optional, Tuple, Union
 import pandas as pd
 from sentence_transformers import SentenceTransformer
 import chromadb
-from dataclasses import dataclass
 import json
+import hashlib
+import threading
+import time
 from datetime import datetime
 from enum import Enum
 import os
@@ -15,7 +17,9 @@ from searchengine import (
     get_user_profile, get_user_nutrition, get_user_chats, 
     get_user_field, build_chatbot_context
 )
-from db import load_index, USERS_DIR
+from db import load_index, load_all_users, add_change_listener, remove_change_listener, USERS_DIR
+from embedding_cache import EmbeddingIndex, EMBEDDINGS_DIR, content_key
+from vector_search import SearchResult, NumpyVectorStore
 
 # ===============================
 # 1. Data Models & Enums
@@ -25,12 +29,6 @@ class SourceType(Enum):
     USER_PROFILE = "profile" 
     CHAT_HISTORY = "chat"
 
-@dataclass
-class SearchResult:
-    documents: List[str]
-    metadata: List[Dict[str, Any]]
-    scores: Optional[List[float]] = None
-
 # ===============================
 # 2. Data Loaders for the System
 # ===============================
@@ -42,11 +40,10 @@ class NutritionDataLoader:
             index = load_index()
             all_profiles = []
             
-            for user_id, file_path in index.items():
-                if os.path.exists(file_path):
-                    profile = get_user_profile(user_id)
-                    if profile:
-                        all_profiles.append(profile)
+            for user_id in index:
+                profile = get_user_profile(user_id)
+                if profile:
+                    all_profiles.append(profile)
             
             print(f"Loaded {len(all_profiles)} user profiles from database")
             return all_profiles
@@ -63,27 +60,7 @@ class NutritionDataLoader:
             all_chats = []
             
             for user_id, file_path in index.items():
-                chats = get_user_chats(user_id)
-                for i, chat in enumerate(chats):
-                    # Convert chat format to our format
-                    all_chats.extend([
-                        {
-                            "message_id": f"{user_id}_chat_{i}_user",
-                            "user_id": user_id,
-                            "timestamp": chat.get("timestamp", ""),
-                            "speaker": "user",
-                            "message": chat.get("user", ""),
-                            "intent": None
-                        },
-                        {
-                            "message_id": f"{user_id}_chat_{i}_bot", 
-                            "user_id": user_id,
-                            "timestamp": chat.get("timestamp", ""),
-                            "speaker": "bot",
-                            "message": chat.get("bot", ""),
-                            "intent": None
-                        }
-                    ])
+                all_chats.extend(NutritionDataLoader.load_user_chat_history(user_id))
             
             print(f"Loaded {len(all_chats)} chat messages from database")
             return all_chats
@@ -91,15 +68,42 @@ class NutritionDataLoader:
         except Exception as e:
             print(f"Error loading chat history: {e}")
             return []
+
+    @staticmethod
+    def load_user_chat_history(user_id: str) -> List[Dict[str, Any]]:
+        """One user's chats as messages; ids follow the chat's position in the log"""
+        messages = []
+        for i, chat in enumerate(get_user_chats(user_id)):
+            # Convert chat format to our format
+            messages.extend([
+                {
+                    "message_id": f"{user_id}_chat_{i}_user",
+                    "user_id": user_id,
+                    "timestamp": chat.get("timestamp", ""),
+                    "speaker": "user",
+                    "message": chat.get("user", ""),
+                    "intent": None
+                },
+                {
+                    "message_id": f"{user_id}_chat_{i}_bot", 
+                    "user_id": user_id,
+                    "timestamp": chat.get("timestamp", ""),
+                    "speaker": "bot",
+                    "message": chat.get("bot", ""),
+                    "intent": None
+                }
+            ])
+        return messages
     
     @staticmethod
     def load_user_specific_data(user_id: str) -> Dict[str, Any]:
         """Load specific user's profile, nutrition, and chat data"""
+        context = build_chatbot_context(user_id)
         return {
-            "profile": get_user_profile(user_id),
-            "nutrition": get_user_nutrition(user_id),
+            "profile": context["profile"] or None,
+            "nutrition": context["nutrition"] if context["profile"] else None,
             "chats": get_user_chats(user_id),
-            "context": build_chatbot_context(user_id)
+            "context": context
         }
 
 # ===============================
@@ -214,22 +218,49 @@ class SentenceTransformerEmbedding(EmbeddingModel):
         """Generate embedding for a single query"""
         return self.model.encode([query]).tolist()[0]
 
+class CachedEmbedding(EmbeddingModel):
+    """Wraps an embedding model with the on-disk, content-addressed embedding index"""
+    def __init__(self, base: SentenceTransformerEmbedding, directory: str = EMBEDDINGS_DIR):
+        self.base = base
+        self.model_name = base.model_name
+        self.index = EmbeddingIndex(base.model_name, directory)
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        """Return cached embeddings, encoding only texts not seen before"""
+        return self.index.embed(texts, self.base.encode).tolist()
+
+    def encode_query(self, query: str) -> List[float]:
+        """Queries are not cached; they are rarely repeated verbatim"""
+        return self.base.encode_query(query)
+
 # ===============================
 # 5. Vector Store Module
 # ===============================
+def _chroma_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Chroma only stores str/int/float/bool values: drop None, JSON-encode the rest"""
+    clean = {}
+    for key, value in metadata.items():
+        if value is None:
+            continue
+        clean[key] = value if isinstance(value, (str, int, float, bool)) else json.dumps(value, default=str)
+    return clean
+
 class ChromaVectorStore:
-    def __init__(self, collection_name: str = "nutrition_assistant", persist_path: str = "./chroma_nutrition"):
+    def __init__(self, collection_name: str = "nutrition_assistant", persist_path: str = "./chroma_nutrition",
+                 reset: bool = True):
+        """reset=False keeps the persisted collection, for incremental updates with IndexSync"""
         self.client = chromadb.PersistentClient(path=persist_path)
         self.collection_name = collection_name
-        self._initialize_collection()
+        self._initialize_collection(reset)
 
-    def _initialize_collection(self):
-        """Initialize or recreate the collection"""
-        try:
-            self.client.delete_collection(self.collection_name)
-        except:
-            pass
-        self.collection = self.client.create_collection(self.collection_name)
+    def _initialize_collection(self, reset: bool = True):
+        """Open the collection, dropping what was persisted unless reset is False"""
+        if reset:
+            try:
+                self.client.delete_collection(self.collection_name)
+            except:
+                pass
+        self.collection = self.client.get_or_create_collection(self.collection_name)
 
     def add_documents(self, documents: List[str], embeddings: List[List[float]],
                      metadata: List[Dict[str, Any]], ids: List[str]):
@@ -241,6 +272,31 @@ class ChromaVectorStore:
             metadatas=metadata
         )
 
+    def upsert(self, documents: List[str], embeddings: List[List[float]],
+               metadata: List[Dict[str, Any]], ids: List[str]):
+        """Add documents, replacing the ones that already have one of the ids"""
+        self.collection.upsert(
+            documents=documents,
+            embeddings=embeddings,
+            ids=ids,
+            metadatas=[_chroma_metadata(m) for m in metadata]
+        )
+
+    def delete(self, ids: List[str]):
+        """Drop the documents with these ids"""
+        if ids:
+            self.collection.delete(ids=list(ids))
+
+    def metadata_values(self, key: str, where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """id -> stored `key` metadata for the documents matching `where`"""
+        stored = self.collection.get(where=where or None, include=["metadatas"])
+        return {id_: (meta or {}).get(key)
+                for id_, meta in zip(stored["ids"], stored.get("metadatas") or [{}] * len(stored["ids"]))}
+
+    def fingerprints(self, where: Optional[Dict[str, Any]] = None) -> Dict[str, Optional[str]]:
+        """id -> stored "fingerprint" metadata for the documents matching `where`"""
+        return self.metadata_values("fingerprint", where)
+
     def search(self, query_embedding: List[float], top_k: int = 5,
                filters: Optional[Dict[str, Any]] = None) -> SearchResult:
         """Search for similar documents"""
@@ -256,3 +312,201 @@ class ChromaVectorStore:
             scores=results.get("distances", [None])[0] if results.get("distances") else None
         )
 
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+def create_vector_store(backend: Optional[str] = None, **kwargs) -> Union[ChromaVectorStore, NumpyVectorStore]:
+    """Build the configured vector store ("chroma" or "numpy"); both share the same interface"""
+    backend = (backend or VECTOR_BACKEND).lower()
+    if backend == "numpy":
+        return NumpyVectorStore()
+    if backend == "chroma":
+        return ChromaVectorStore(**kwargs)
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+# ===============================
+# 6. Incremental Index Sync
+# ===============================
+# Documents embedded per model call / written per upsert
+SYNC_BATCH_SIZE = 256
+# Seconds between background syncs of the users whose data changed
+RAG_SYNC_INTERVAL = float(os.getenv("RAG_SYNC_INTERVAL", "30"))
+
+def document_fingerprint(model_name: str, document: str, metadata: Dict[str, Any]) -> str:
+    """Changes whenever the document text, its metadata or the embedding model does"""
+    fields = json.dumps({k: v for k, v in metadata.items() if k != "fingerprint"}, sort_keys=True, default=str)
+    return hashlib.sha256(f"{content_key(model_name, document)}\n{fields}".encode("utf-8")).hexdigest()
+
+class IndexSync:
+    """
+    Keeps a vector store in step with the food CSV and the user database
+    without rebuilding it. Documents are upserted by source_id with a content
+    fingerprint stored in their metadata; only new or changed documents are
+    embedded, and documents whose source disappeared are deleted.
+
+    sync_all() diffs every source (run it as a periodic job); sync_user()
+    covers one user's profile and chats. watch() subscribes to db writes so
+    the background loop started by start() syncs just the users that changed.
+    """
+
+    def __init__(self, store: Union[ChromaVectorStore, NumpyVectorStore], embedding: EmbeddingModel,
+                 csv_path: Optional[str] = "cleaned_food_data.csv"):
+        self.store = store
+        self.embedding = embedding
+        self.csv_path = csv_path
+        self._csv_mtime = None
+        self._sync_lock = threading.Lock()
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _apply(self, documents: List[str], metadata: List[Dict[str, Any]],
+               where: Dict[str, Any]) -> Dict[str, int]:
+        """Make the documents matching `where` equal to `documents`"""
+        ids = [str(meta["source_id"]) for meta in metadata]
+        fingerprints = [document_fingerprint(self.embedding.model_name, doc, meta)
+                        for doc, meta in zip(documents, metadata)]
+        existing = self.store.fingerprints(where)
+        changed = [i for i, (id_, fingerprint) in enumerate(zip(ids, fingerprints))
+                   if existing.get(id_) != fingerprint]
+        stale = sorted(set(existing) - set(ids))
+        # Content keys of the texts being replaced or deleted, read before they are overwritten
+        old_keys = self.store.metadata_values("embedding_key", where) if changed or stale else {}
+        replaced = {old_keys.get(ids[i]) for i in changed} | {old_keys.get(id_) for id_ in stale}
+
+        for start in range(0, len(changed), SYNC_BATCH_SIZE):
+            batch = changed[start:start + SYNC_BATCH_SIZE]
+            texts = [documents[i] for i in batch]
+            self.store.upsert(texts, self.embedding.encode(texts),
+                              [{**metadata[i], "fingerprint": fingerprints[i],
+                                "embedding_key": content_key(self.embedding.model_name, documents[i])}
+                               for i in batch],
+                              [ids[i] for i in batch])
+        self.store.delete(stale)
+        self._discard_embeddings(replaced - {None})
+
+        added = sum(1 for i in changed if ids[i] not in existing)
+        return {"added": added, "updated": len(changed) - added, "deleted": len(stale),
+                "unchanged": len(ids) - len(changed)}
+
+    def _discard_embeddings(self, keys: set):
+        """Drop cached vectors of replaced texts that no document in the store still uses"""
+        if not keys or not isinstance(self.embedding, CachedEmbedding):
+            return
+        keys -= set(self.store.metadata_values("embedding_key").values())
+        self.embedding.index.discard(keys)
+
+    @staticmethod
+    def _merge(*results: Dict[str, int]) -> Dict[str, int]:
+        return {key: sum(r[key] for r in results) for key in ("added", "updated", "deleted", "unchanged")}
+
+    def sync_nutrition(self, force: bool = False) -> Dict[str, int]:
+        """Food rows; skipped while the CSV's mtime is unchanged unless force"""
+        if not self.csv_path or not os.path.exists(self.csv_path):
+            return self._merge()
+        mtime = os.path.getmtime(self.csv_path)
+        if mtime == self._csv_mtime and not force:
+            return self._merge()
+        documents, metadata = NutritionCSVProcessor().process_data(pd.read_csv(self.csv_path))
+        result = self._apply(documents, metadata, {"source_type": SourceType.NUTRITION_CSV.value})
+        self._csv_mtime = mtime
+        return result
+
+    def sync_user(self, user_id: str) -> Dict[str, int]:
+        """One user's profile and chats; everything indexed for a deleted user is removed"""
+        with self._sync_lock:
+            profile = get_user_profile(user_id)
+            documents, metadata = UserProfileProcessor().process_data([profile] if profile else [])
+            chat_documents, chat_metadata = ChatHistoryProcessor().process_data(
+                NutritionDataLoader.load_user_chat_history(user_id) if profile else [])
+            return self._apply(documents + chat_documents, metadata + chat_metadata, {"user_id": user_id})
+
+    def sync_all(self, force: bool = False) -> Dict[str, int]:
+        """Every source; the cost of a run with no changes is reading and hashing, not embedding"""
+        with self._sync_lock:
+            # Swap the marks out before reading, so a write that lands during the read stays marked
+            with self._dirty_lock:
+                self._dirty = set()
+            users = load_all_users()
+            profiles = [get_user_profile(user_id, data) for user_id, data in users.items()]
+            messages = [msg for user_id in users for msg in NutritionDataLoader.load_user_chat_history(user_id)]
+            return self._merge(
+                self.sync_nutrition(force),
+                self._apply(*UserProfileProcessor().process_data(profiles),
+                            {"source_type": SourceType.USER_PROFILE.value}),
+                self._apply(*ChatHistoryProcessor().process_data(messages),
+                            {"source_type": SourceType.CHAT_HISTORY.value}),
+            )
+
+    def mark_dirty(self, user_id: str):
+        with self._dirty_lock:
+            self._dirty.add(user_id)
+
+    def flush(self) -> Dict[str, int]:
+        """sync_user() for every user changed since the last flush"""
+        with self._dirty_lock:
+            user_ids, self._dirty = self._dirty, set()
+        results = []
+        for user_id in sorted(user_ids):
+            try:
+                results.append(self.sync_user(user_id))
+            except Exception as e:
+                print(f"Error syncing user {user_id}: {e}")
+                self.mark_dirty(user_id)
+        return self._merge(*results)
+
+    def watch(self):
+        """Mark users dirty whenever db writes their document or chats"""
+        add_change_listener(self.mark_dirty)
+        return self
+
+    def start(self, interval: float = RAG_SYNC_INTERVAL, full: bool = False):
+        """
+        Background loop: every `interval` seconds flush() the changed users, or
+        run sync_all() when full=True (for processes that don't see db writes).
+        """
+        if self._thread is not None:
+            return self
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    result = self.sync_all() if full else self.flush()
+                except Exception as e:
+                    print(f"Error syncing vector index: {e}")
+                    continue
+                if result["added"] or result["updated"] or result["deleted"]:
+                    print(f"Vector index synced: {result}")
+
+        self._thread = threading.Thread(target=loop, name="rag-index-sync", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        remove_change_listener(self.mark_dirty)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Incrementally sync the persisted Chroma index with the data")
+    parser.add_argument("--interval", type=float, default=RAG_SYNC_INTERVAL,
+                        help="seconds between syncs (default %(default)s)")
+    parser.add_argument("--once", action="store_true", help="sync once and exit")
+    parser.add_argument("--persist-path", default="./chroma_nutrition")
+    parser.add_argument("--csv", default="cleaned_food_data.csv")
+    args = parser.parse_args()
+
+    sync = IndexSync(ChromaVectorStore(persist_path=args.persist_path, reset=False),
+                     CachedEmbedding(SentenceTransformerEmbedding()), csv_path=args.csv)
+    while True:
+        started = time.perf_counter()
+        result = sync.sync_all()
+        print(f"Synced in {time.perf_counter() - started:.2f}s: {result}")
+        if args.once:
+            break
+        time.sleep(args.interval)
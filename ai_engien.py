@@ -9,6 +9,7 @@ from langchain.chains import LLMChain
 from langchain_community.vectorstores import Chroma
 from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.schema import Document
+from embedding_cache import CachedEmbeddings
 
 dotenv.load_dotenv()
 API_KEY = os.getenv("Gemini_api_key")
@@ -38,7 +39,10 @@ def load_food_data(csv_file_path="cleaned_food_data.csv"):
         raise Exception(f"Error loading CSV data: {str(e)}")
 
 def setup_vector_store(documents):
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    embeddings = CachedEmbeddings(
+        "all-MiniLM-L6-v2",
+        factory=lambda: HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    )
     vector_store = Chroma.from_documents(documents, embeddings, collection_name="food_data")
     return vector_store
 
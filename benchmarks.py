@@ -0,0 +1,574 @@
+"""
+Offline micro-benchmarks for the chat, storage and retrieval hot paths.
+
+Everything runs against a throwaway data dir with a deterministic fake LLM
+and a hashing embedder in place of Gemini and MiniLM, so results only move
+when our own code does. Each run writes a JSON file that a later run can be
+compared against:
+
+    python benchmarks.py --output before.json
+    ... change things ...
+    python benchmarks.py --compare before.json
+
+Groups (--only): chat, chats, index, context, retrieval. Sizes come from the
+profile (--quick, default, --full); --full adds the 1M-row catalog, which
+needs about 4 GB of memory.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+PROFILES = {
+    "quick": {
+        "chat_counts": [10, 1000],
+        "user_counts": [10000],
+        "catalog_rows": [500, 10000],
+        "chat_requests": 20,
+    },
+    "default": {
+        "chat_counts": [10, 1000, 10000, 100000],
+        "user_counts": [10000],
+        "catalog_rows": [500, 10000, 100000],
+        "chat_requests": 50,
+    },
+    "full": {
+        "chat_counts": [10, 1000, 10000, 100000],
+        "user_counts": [10000, 50000],
+        "catalog_rows": [500, 10000, 100000, 1000000],
+        "chat_requests": 200,
+    },
+}
+GROUPS = ["chat", "chats", "index", "context", "retrieval"]
+
+# A benchmark only counts as regressed when it is this much slower, relatively
+# and in absolute terms (sub-50µs differences are timer noise)
+REGRESSION_THRESHOLD = 0.15
+REGRESSION_MIN_DELTA_MS = 0.05
+
+QUESTIONS = [
+    "What should I eat before a morning run?",
+    "Give me a high protein breakfast idea",
+    "Is rice better than pasta for my goal?",
+    "How can I cut down on sugar cravings?",
+    "What are good snacks for late at night?",
+    "Suggest a vegetarian dinner with enough protein",
+    "How much water should I drink on training days?",
+    "Which cheeses are lowest in fat?",
+]
+FOOD_FACT_QUESTION = "how many calories in cream cheese"
+
+
+# --- fakes ------------------------------------------------------------------
+
+class HashingEmbeddings:
+    """
+    Deterministic stand-in for the MiniLM embeddings: words and word pairs are
+    hashed into `dim` signed buckets. Similar texts still land close together,
+    which keeps retrieval and the response cache behaving realistically.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _vector(self, text: str) -> List[float]:
+        words = re.findall(r"\w+", (text or "").lower())
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(list(texts))
+
+
+class FakeLLM:
+    """Deterministic answer built from a hash of the prompt, with optional simulated latency."""
+
+    WORDS = ["🍎", "Eat", "more", "vegetables,", "lean", "protein", "and", "whole", "grains.", "1.", "2.",
+             "Oats", "with", "berries", "🥦", "keep", "portions", "steady", "and", "drink", "water."]
+
+    def __init__(self, tokens: int = 60, first_token_ms: float = 0.0, token_ms: float = 0.0):
+        self.tokens = tokens
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+
+    def stream(self, prompt: str):
+        seed = hashlib.sha256(prompt.encode("utf-8")).digest()
+        if self.first_token_ms:
+            time.sleep(self.first_token_ms / 1000)
+        for i in range(self.tokens):
+            if i and self.token_ms:
+                time.sleep(self.token_ms / 1000)
+            yield self.WORDS[seed[i % len(seed)] % len(self.WORDS)] + " "
+
+
+class FakeChain:
+    """Same surface as RAGRuntime.new_chain(): formats the real prompt and streams the fake answer."""
+
+    def __init__(self, prompt, llm: FakeLLM, timings: Dict[str, float]):
+        self.prompt = prompt
+        self.llm = llm
+        self.timings = timings
+
+    def stream(self, input_data: dict):
+        started = time.perf_counter()
+        try:
+            yield from self.llm.stream(self.prompt.format(**input_data))
+        finally:
+            self.timings["llm"] = (time.perf_counter() - started) * 1000
+
+    def invoke(self, input_data: dict) -> str:
+        return "".join(self.stream(input_data))
+
+
+# --- measurement ------------------------------------------------------------
+
+def stats(samples_ms: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "n": int(len(values)),
+        "median_ms": round(float(np.median(values)), 4),
+        "p95_ms": round(float(np.percentile(values, 95)), 4),
+        "min_ms": round(float(values.min()), 4),
+        "mean_ms": round(float(values.mean()), 4),
+    }
+
+
+def measure(fn: Callable[[], Any], repeat: int = 50, warmup: int = 2,
+            setup: Optional[Callable[[], Any]] = None, max_seconds: float = 10.0) -> Dict[str, float]:
+    """Times `fn` `repeat` times (fewer if it runs past max_seconds); `setup` runs untimed before each call."""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    samples = []
+    deadline = time.perf_counter() + max_seconds
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+        if time.perf_counter() > deadline and len(samples) >= 3:
+            break
+    return stats(samples)
+
+
+# --- fixtures ---------------------------------------------------------------
+
+def _profile(user_id: str, i: int = 0) -> dict:
+    import db
+    data = {
+        "user_id": user_id,
+        "name": f"bench user {i}",
+        "age": 20 + i % 50,
+        "weight": 55 + i % 60,
+        "height": 155 + i % 40,
+        "gender": "male" if i % 2 else "female",
+        "goal": ["loss", "gain", "maintenance"][i % 3],
+        "activity_level": "moderate",
+        "surplus": 400,
+        "created_at": "2024-01-01 00:00:00",
+        "language": "en",
+    }
+    data["nutrition"] = db.compute_nutrition(data)
+    return data
+
+
+def _chat(i: int) -> dict:
+    return {
+        "user": QUESTIONS[i % len(QUESTIONS)],
+        "bot": f"Answer {i}: eat more vegetables, lean protein and whole grains. " * 3,
+        "timestamp": "2024-01-01 00:00:00",
+    }
+
+
+def seed_users(profiles: List[dict], chat_count: int = 0) -> None:
+    """
+    Writes users straight to storage in one pass: going through
+    create_user_file would rewrite index.json once per user.
+    """
+    import db
+    chats = [_chat(i) for i in range(chat_count)]
+    storage = db.get_storage()
+    if storage is not None:
+        for data in profiles:
+            storage.import_user(data, chats)
+        return
+    db.ensure_data_dir()
+    chat_lines = "".join(json.dumps(chat, ensure_ascii=False) + "\n" for chat in chats)
+    added = {}
+    for data in profiles:
+        path = db.user_filename(data["user_id"], data["name"])
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        with open(db.chat_log_path(path), "w", encoding="utf-8") as f:
+            f.write(chat_lines)
+        added[data["user_id"]] = path
+    db.save_index({**db.load_index(), **added})
+
+
+def _touch(path: str):
+    """Bumps the mtime so stat-validated caches have to re-read the file."""
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+
+
+# --- benchmark groups ---------------------------------------------------------
+
+def bench_chats(config: dict) -> Dict[str, Any]:
+    """db.add_chat and db.get_chats against users with 10 to 100k stored chats."""
+    import db
+    results = {}
+    for count in config["chat_counts"]:
+        user_id = f"bench_chats_{count}"
+        seed_users([_profile(user_id)], chat_count=count)
+        results[f"chats.get_chats_last5[n={count}]"] = measure(lambda: db.get_chats(user_id, limit=5), repeat=200)
+        results[f"chats.get_chats_all[n={count}]"] = measure(lambda: db.get_chats(user_id),
+                                                             repeat=20 if count >= 10000 else 100)
+        results[f"chats.add_chat[n={count}]"] = measure(
+            lambda: db.add_chat(user_id, QUESTIONS[0], "Benchmark answer with a few words in it."), repeat=200)
+    return results
+
+
+def bench_index(config: dict) -> Dict[str, Any]:
+    """load_index / get_user_file_path with 10k+ users, from the in-memory copy and after a change on disk."""
+    import db
+    results = {}
+    seeded = 0
+    for count in config["user_counts"]:
+        seed_users([_profile(f"bench_index_{i}", i) for i in range(seeded, count)])
+        seeded = count
+        probe = f"bench_index_{count // 2}"
+        results[f"index.load_index_warm[users={count}]"] = measure(db.load_index, repeat=50)
+        results[f"index.get_user_file_path[users={count}]"] = measure(lambda: db.get_user_file_path(probe),
+                                                                      repeat=500)
+        if db.get_storage() is None:
+            results[f"index.load_index_cold[users={count}]"] = measure(
+                db.load_index, repeat=20, setup=lambda: _touch(db.INDEX_FILE))
+    return results
+
+
+def bench_context(config: dict) -> Dict[str, Any]:
+    """searchengine.build_chatbot_context for a user with 1k chats."""
+    import db
+    from searchengine import build_chatbot_context
+    user_id = "bench_context"
+    seed_users([_profile(user_id)], chat_count=1000)
+    return {
+        "context.build_chatbot_context_warm": measure(lambda: build_chatbot_context(user_id), repeat=200),
+        "context.build_chatbot_context_cold": measure(lambda: build_chatbot_context(user_id), repeat=100,
+                                                      setup=db.invalidate_user_cache),
+    }
+
+
+def _bench_retrieval_size(rows: int, queries: np.ndarray, rng, top_k: int) -> Dict[str, Any]:
+    """Build and search timings for one catalog size; its arrays are freed when it returns."""
+    from vector_search import NumpyVectorStore
+    names = [f"food {i}" for i in range(rows)]
+    vectors = rng.standard_normal((rows, queries.shape[1]), dtype=np.float32)
+    metadata = [{"food": name} for name in names]
+    ids = [str(i) for i in range(rows)]
+
+    def build():
+        store = NumpyVectorStore()
+        store.add_documents(names, vectors, metadata, ids)
+        return store
+
+    huge = rows >= 1000000
+    results = {f"retrieval.build[rows={rows}]": measure(build, repeat=1 if huge else 5, warmup=0)}
+    store = build()
+    repeat = 20 if huge else 100
+    results[f"retrieval.search_top{top_k}[rows={rows}]"] = measure(
+        lambda: store.search(queries[0], top_k=top_k), repeat=repeat)
+    results[f"retrieval.search_batch32_top{top_k}[rows={rows}]"] = measure(
+        lambda: store.search_batch(queries, top_k=top_k), repeat=max(5, repeat // 5))
+    return results
+
+
+def bench_retrieval(config: dict, dim: int = 384, top_k: int = 5) -> Dict[str, Any]:
+    """
+    Exact top-k over synthetic catalogs. Vectors are random rather than
+    embedded text: the cost of a search only depends on the matrix shape.
+    """
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((32, dim), dtype=np.float32)
+    results = {}
+    for rows in config["catalog_rows"]:
+        results.update(_bench_retrieval_size(rows, queries, rng, top_k))
+    return results
+
+
+def _bench_runtime(chatbot, llm: FakeLLM, timings: Dict[str, float]):
+    """A RAGRuntime over the real food CSV and prompt, with the fakes swapped in for the models."""
+    from vector_search import NumpyVectorStore
+    embeddings = HashingEmbeddings()
+
+    class BenchRuntime(chatbot.RAGRuntime):
+        def _build(self):
+            documents = chatbot.load_food_data(self.csv_file_path)
+            self._llm = llm
+            self._vector_store = NumpyVectorStore.from_documents(documents, embeddings)
+            self._prompt = chatbot.create_prompt_template()
+            self.loaded_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        def embed_query(self, query):
+            return embeddings.embed_query(query)
+
+        def embed_queries(self, queries):
+            return embeddings.embed_queries(queries)
+
+        def new_chain(self):
+            return FakeChain(self.prompt, self.llm, timings)
+
+    csv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cleaned_food_data.csv")
+    return BenchRuntime(csv_path).warm_up()
+
+
+def bench_chat(config: dict, llm_first_token_ms: float = 0.0, llm_token_ms: float = 0.0,
+               image_ms: float = 50.0, voice_ms: float = 30.0) -> Dict[str, Any]:
+    """
+    get_bot_response end to end and per stage (StageRunner timings, prompt
+    assembly and the fake LLM call) for text, response-cache hits, food-fact
+    lookups and image+voice requests. Image analysis and speech recognition
+    are replaced by sleeps of image_ms / voice_ms.
+    """
+    import chatbot
+    import db
+    from stages import StageRunner
+
+    timings: Dict[str, float] = {}
+    runners: List[StageRunner] = []
+
+    class RecordingRunner(StageRunner):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            runners.append(self)
+
+    def timed(name, fn):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings[name] = (time.perf_counter() - started) * 1000
+        return wrapper
+
+    def fake_image(image_bytes, mime_type=None):
+        time.sleep(image_ms / 1000)
+        return "Estimated: grilled chicken with rice, about 550 kcal."
+
+    def fake_voice(audio_data):
+        time.sleep(voice_ms / 1000)
+        return QUESTIONS[len(audio_data) % len(QUESTIONS)]
+
+    user_id = "bench_chat"
+    seed_users([_profile(user_id)], chat_count=50)
+    patched = {
+        "_runtime": _bench_runtime(chatbot, FakeLLM(first_token_ms=llm_first_token_ms, token_ms=llm_token_ms),
+                                   timings),
+        "StageRunner": RecordingRunner,
+        "_prompt_input": timed("prompt", chatbot._prompt_input),
+        "analyze_food_image": fake_image,
+        "analyze_voice": fake_voice,
+    }
+    originals = {name: getattr(chatbot, name) for name in list(patched) + ["RESPONSE_CACHE_ENABLED"]}
+
+    def run(scenario: str, requests: int, cache: bool, make_args: Callable[[int], tuple]) -> Dict[str, Any]:
+        chatbot.RESPONSE_CACHE_ENABLED = cache
+        chatbot.response_cache.clear()
+        totals, stages = [], {}
+        for i in range(requests + 2):  # the first two are warm-up
+            timings.clear()
+            runners.clear()
+            started = time.perf_counter()
+            answer = chatbot.get_bot_response(user_id, *make_args(i))
+            elapsed = (time.perf_counter() - started) * 1000
+            if answer.startswith("Error"):
+                raise RuntimeError(f"{scenario}: {answer}")
+            if i < 2:
+                continue
+            totals.append(elapsed)
+            for name, ms in list(timings.items()) + [item for r in runners for item in r.timings.items()]:
+                stages.setdefault(name, []).append(ms)
+        out = {f"chat.{scenario}.total": stats(totals)}
+        for name, samples in sorted(stages.items()):
+            out[f"chat.{scenario}.stage.{name}"] = stats(samples)
+        return out
+
+    requests = config["chat_requests"]
+    results = {}
+    try:
+        for name, value in patched.items():
+            setattr(chatbot, name, value)
+        results.update(run("text", requests, False, lambda i: (QUESTIONS[i % len(QUESTIONS)],)))
+        results.update(run("text_cache_hit", requests, True, lambda i: (QUESTIONS[0],)))
+        results.update(run("food_fact", requests, False, lambda i: (FOOD_FACT_QUESTION,)))
+        results.update(run("image_voice", max(5, requests // 5), False,
+                           lambda i: (None, b"\xff\xd8\xff" + bytes(i), b"RIFF" + bytes(i))))
+    finally:
+        for name, value in originals.items():
+            setattr(chatbot, name, value)
+        # Background summary/image writes must finish before the data dir goes away
+        time.sleep(0.2)
+    db.invalidate_user_cache()
+    return results
+
+
+# --- results ----------------------------------------------------------------
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = REGRESSION_THRESHOLD,
+            min_delta_ms: float = REGRESSION_MIN_DELTA_MS) -> List[dict]:
+    """Median-to-median comparison of two result files; entries are flagged "regression" or "improvement"."""
+    rows = []
+    old_results, new_results = baseline.get("results", {}), current.get("results", {})
+    for name in sorted(set(old_results) & set(new_results)):
+        old, new = old_results[name]["median_ms"], new_results[name]["median_ms"]
+        change = (new - old) / old if old else 0.0
+        status = "ok"
+        if abs(new - old) >= min_delta_ms and abs(change) >= threshold:
+            status = "regression" if new > old else "improvement"
+        rows.append({"name": name, "baseline_ms": old, "current_ms": new, "change": round(change, 4),
+                     "status": status})
+    return rows
+
+
+def run_benchmarks(profile: str = "default", only: Optional[List[str]] = None, **chat_options) -> Dict[str, Any]:
+    config = PROFILES[profile]
+    runners = {
+        "chat": lambda: bench_chat(config, **chat_options),
+        "chats": lambda: bench_chats(config),
+        "index": lambda: bench_index(config),
+        "context": lambda: bench_context(config),
+        "retrieval": lambda: bench_retrieval(config),
+    }
+    results, skipped = {}, {}
+    for group in only or GROUPS:
+        started = time.perf_counter()
+        try:
+            results.update(runners[group]())
+        except ImportError as e:  # e.g. chat without the LangChain/Gemini packages installed
+            skipped[group] = f"missing dependency: {str(e)}"
+            print(f"⚠️ Skipped {group}: {skipped[group]}")
+            continue
+        print(f"✅ {group} done in {time.perf_counter() - started:.1f}s")
+    import db
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "profile": profile,
+            "backend": "sqlite" if db.get_storage() is not None else "json",
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "chat_options": chat_options,
+            "skipped": skipped,
+        },
+        "results": results,
+    }
+
+
+def _print_results(report: Dict[str, Any]):
+    width = max((len(name) for name in report["results"]), default=10)
+    print(f"\n{'benchmark':<{width}}  {'median ms':>10}  {'p95 ms':>10}  {'n':>5}")
+    for name, row in report["results"].items():
+        print(f"{name:<{width}}  {row['median_ms']:>10.3f}  {row['p95_ms']:>10.3f}  {row['n']:>5}")
+
+
+def _print_comparison(rows: List[dict], baseline_meta: dict):
+    print(f"\nCompared with {baseline_meta.get('commit') or 'baseline'} ({baseline_meta.get('timestamp', '?')}):")
+    width = max((len(row["name"]) for row in rows), default=10)
+    for row in rows:
+        if row["status"] == "ok":
+            continue
+        mark = "❌" if row["status"] == "regression" else "🚀"
+        print(f"{mark} {row['name']:<{width}}  {row['baseline_ms']:>10.3f} -> {row['current_ms']:>10.3f} ms "
+              f"({row['change']:+.0%})")
+    regressions = sum(1 for row in rows if row["status"] == "regression")
+    improvements = sum(1 for row in rows if row["status"] == "improvement")
+    print(f"{len(rows)} compared: {regressions} regressions, {improvements} improvements")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the chat, storage and retrieval paths")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--quick", action="store_const", dest="profile", const="quick", help="small sizes")
+    size.add_argument("--full", action="store_const", dest="profile", const="full",
+                      help="largest sizes, including the 1M-row catalog")
+    parser.add_argument("--only", help=f"comma-separated groups: {','.join(GROUPS)}")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json", help="storage backend to measure")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="relative slowdown of the median that counts as a regression")
+    parser.add_argument("--llm-first-token-ms", type=float, default=0.0, help="simulated LLM time to first token")
+    parser.add_argument("--llm-token-ms", type=float, default=0.0, help="simulated LLM time per token")
+    parser.add_argument("--keep-data", action="store_true", help="don't delete the temporary data dir")
+    args = parser.parse_args(argv)
+
+    only = [g.strip() for g in args.only.split(",")] if args.only else None
+    unknown = set(only or []) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(sorted(unknown))}")
+    if "db" in sys.modules:
+        parser.error("run benchmarks.py as a script so it can point db at a temporary data dir")
+
+    data_dir = tempfile.mkdtemp(prefix="dietitian_bench_")
+    # db reads these at import time; nothing below touches the real data dir
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["DB_BACKEND"] = args.backend
+    os.environ["DB_PATH"] = os.path.join(data_dir, "users.db")
+    print(f"Using temporary data dir {data_dir}")
+    try:
+        report = run_benchmarks(args.profile or "default", only, llm_first_token_ms=args.llm_first_token_ms,
+                                llm_token_ms=args.llm_token_ms)
+    finally:
+        if not args.keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    _print_results(report)
+    regressions = 0
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.threshold)
+        report["comparison"] = {"baseline": baseline.get("meta", {}), "threshold": args.threshold, "rows": rows}
+        _print_comparison(rows, baseline.get("meta", {}))
+        regressions = sum(1 for row in rows if row["status"] == "regression")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.output}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
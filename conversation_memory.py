@@ -0,0 +1,174 @@
+import logging
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Stored in the user record under this key
+SUMMARY_KEY = "conversation_summary"
+# Condensed turns kept in the rolling summary, oldest dropped first
+SUMMARY_MAX_TURNS = 12
+SUMMARY_MAX_CHARS = 1500
+# Things the user said about themselves ("I'm vegetarian", "allergic to nuts")
+SUMMARY_MAX_FACTS = 10
+
+_EMOJI_RE = re.compile(
+    "[\U0001F000-\U0001FAFF\U00002600-\U000027BF\U0001F900-\U0001F9FF\U00002B00-\U00002BFF️‍]+"
+)
+_MARKUP_RE = re.compile(r"(\*\*|__|`|^#+\s*|^\s*(?:[-*•]|\d+[.)])\s+)", re.MULTILINE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_FACT_RE = re.compile(
+    r"\b(i am|i'm|im|i have|i've got|my|i don't|i dont|i do not|i can't|i cant|i never|i only|"
+    r"i'm allergic|allergic to|i prefer|i train|i work out|i run|i eat)\b[^.!?\n]{3,100}",
+    re.IGNORECASE
+)
+# "my" phrases that just ask for something aren't facts
+_NOT_FACT_RE = re.compile(r"\b(my macros|my calories|my plan|my meals|my diet plan|a question)\b", re.IGNORECASE)
+_MESSAGE_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_QUESTION_WORDS = r"what|how|why|when|where|which|who|should|shall|can|could|would|will|is|are|am|do|does|did|may"
+# A new clause starts at ";" or at a comma/conjunction followed by "I ..." or a question word,
+# so "nuts, eggs and milk" stays in one piece
+_CLAUSE_RE = re.compile(
+    r"\s*;\s*|\s*(?:,\s*(?:(?:and|but|so|because)\s+)?|\s+(?:and|but|so|because)\s+)"
+    r"(?=(?:i|i'm|im|i've|" + _QUESTION_WORDS + r")\b)",
+    re.IGNORECASE
+)
+_QUESTION_START_RE = re.compile(r"^(?:" + _QUESTION_WORDS + r")\b", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English, more for emojis)."""
+    return (len(text) + 3) // 4
+
+
+def clean_text(text: str) -> str:
+    """Drops emojis and list/markdown markup and collapses whitespace."""
+    text = _EMOJI_RE.sub("", text or "")
+    text = _MARKUP_RE.sub("", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _clip(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0]
+    return cut.rstrip(",;:") + "…"
+
+
+def condense_turn(user_message: str, bot_response: str, question_chars: int = 100,
+                  answer_chars: int = 160) -> str:
+    """One short line per exchange: the question and the first sentence or two of the answer."""
+    question = _clip(clean_text(user_message), question_chars)
+    sentences = _SENTENCE_RE.split(clean_text(bot_response))
+    answer = ""
+    for sentence in sentences:
+        if answer and len(answer) + len(sentence) > answer_chars:
+            break
+        answer = f"{answer} {sentence}".strip()
+    return f"Q: {question} → A: {_clip(answer, answer_chars)}"
+
+
+def _statement_clauses(user_message: str) -> List[str]:
+    """Clauses of the message that are not questions"""
+    clauses = []
+    for sentence in _MESSAGE_SENTENCE_RE.split(user_message or ""):
+        sentence = clean_text(sentence)
+        parts = [part.strip(" .!?") for part in _CLAUSE_RE.split(sentence)]
+        for i, part in enumerate(parts):
+            # "What should I eat", or the clause a "?" closes: "..., and can I have rice?"
+            if _QUESTION_START_RE.match(part) or (sentence.endswith("?") and i == len(parts) - 1):
+                continue
+            clauses.append(part)
+    return clauses
+
+
+def extract_facts(user_message: str) -> List[str]:
+    facts = []
+    for clause in _statement_clauses(user_message):
+        if _NOT_FACT_RE.search(clause):
+            continue
+        for match in _FACT_RE.finditer(clause):
+            facts.append(match.group(0).rstrip(",;: "))
+    return facts
+
+
+def update_summary(data: Dict[str, Any], user_message: str, bot_response: str) -> Optional[bool]:
+    """
+    Folds one exchange into the rolling summary stored in the user record.
+    Meant as an update_user_data mutator: pure string work, no model call.
+    """
+    if not user_message or not bot_response or bot_response.startswith("Error"):
+        return False
+    summary = data.get(SUMMARY_KEY) or {}
+    turns: List[str] = list(summary.get("turns", []))
+    facts: List[str] = list(summary.get("facts", []))
+
+    turns.append(condense_turn(user_message, bot_response))
+    while len(turns) > SUMMARY_MAX_TURNS or (len(turns) > 1 and sum(map(len, turns)) > SUMMARY_MAX_CHARS):
+        turns.pop(0)
+    for fact in extract_facts(user_message):
+        key = fact.lower()
+        facts = [f for f in facts if f.lower() != key]
+        facts.append(fact)
+    facts = facts[-SUMMARY_MAX_FACTS:]
+
+    data[SUMMARY_KEY] = {
+        "turns": turns,
+        "facts": facts,
+        "count": summary.get("count", 0) + 1,
+        "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def build_chat_history(summary: Optional[Dict[str, Any]], recent_chats: List[Dict[str, Any]],
+                       verbatim_turns: int = 2, max_bot_chars: int = 800) -> List[str]:
+    """
+    History blocks, oldest first: what the user told us, condensed earlier
+    turns, then the newest `verbatim_turns` exchanges word for word (long
+    answers clipped). Returned as a list so the budget can drop from the front.
+    """
+    summary = summary or {}
+    recent = recent_chats[-verbatim_turns:] if verbatim_turns else []
+    # The newest turns are already in the summary; don't repeat them
+    shown = {condense_turn(chat["user"], chat["bot"]) for chat in recent}
+    condensed = [turn for turn in summary.get("turns", []) if turn not in shown]
+    blocks = []
+    if summary.get("facts"):
+        blocks.append("About the user: " + "; ".join(summary["facts"]))
+    if condensed:
+        blocks.append("Earlier in this conversation:\n" + "\n".join(condensed))
+    for chat in recent:
+        blocks.append(f"User: {chat['user']}\nBot: {_clip(clean_text(chat['bot']), max_bot_chars)}")
+    return blocks
+
+
+def fit_prompt_budget(fixed_text: str, food_context: str, history_blocks: List[str],
+                      budget_tokens: int) -> Dict[str, str]:
+    """
+    Trims the variable parts of the prompt until it fits `budget_tokens`.
+    Drops the oldest history first (keeping the newest exchange), then
+    trailing retrieved food lines (the leading plan/image lines are kept
+    longest), then clips what is left.
+    """
+    blocks = list(history_blocks)
+    lines = food_context.split("\n") if food_context else []
+
+    def total():
+        return estimate_tokens(fixed_text) + estimate_tokens("\n".join(blocks)) + estimate_tokens("\n".join(lines))
+
+    while total() > budget_tokens and len(blocks) > 1:
+        # "About the user" facts are small and worth keeping over old turns
+        drop = 1 if blocks[0].startswith("About the user") and len(blocks) > 2 else 0
+        blocks.pop(drop)
+    while total() > budget_tokens and len(lines) > 1:
+        lines.pop()
+    history, context = "\n".join(blocks), "\n".join(lines)
+    overflow = total() - budget_tokens
+    if overflow > 0:
+        # Clip the longer of the two by what's left over
+        if len(history) >= len(context):
+            history = _clip(history, max(0, len(history) - overflow * 4))
+        else:
+            context = _clip(context, max(0, len(context) - overflow * 4))
+    return {"chat_history": history, "food_context": context}
@@ -1,14 +1,48 @@
 #db.py
+import copy
+import functools
+import hashlib
 import json
 import os
 import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Dict, List, Optional
 
-DATA_DIR = "data"
+from metrics import DB_SECONDS, timed
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
 USERS_DIR = os.path.join(DATA_DIR, "users")
 INDEX_FILE = os.path.join(DATA_DIR, "index.json")
 MENUS_FILE = os.path.join(DATA_DIR, "menus.json")
+LOCKS_DIR = os.path.join(DATA_DIR, "locks")
+
+# "json" (one file per user, the default) or "sqlite" (see storage.py)
+STORAGE_BACKEND = os.getenv("DB_BACKEND", "json").lower()
+SQLITE_PATH = os.getenv("DB_PATH", os.path.join(DATA_DIR, "users.db"))
+_storage = None
+
+def get_storage():
+    """Returns the configured storage backend, or None for the JSON files."""
+    global _storage
+    if _storage is None and STORAGE_BACKEND == "sqlite":
+        from storage import SQLiteStorage
+        _storage = SQLiteStorage(SQLITE_PATH)
+    return _storage
+
+def set_storage(storage):
+    global _storage
+    _storage = storage
 
 def ensure_data_dir():
     if not os.path.exists(DATA_DIR):
@@ -19,16 +53,181 @@ def ensure_data_dir():
         with open(INDEX_FILE, "w", encoding="utf-8") as f:
             json.dump({}, f, ensure_ascii=False, indent=4)
 
-def load_index():
-    ensure_data_dir()
+# In-memory copy of index.json, revalidated with a single os.stat() per lookup
+# so several server processes still see each other's writes
+_index_lock = threading.Lock()
+_index_cache = {"data": None, "stat": None}
+_index_stats = {"hits": 0, "misses": 0}
+
+# Cross-process write coordination. Every read-modify-write of a user file,
+# chat log append and index.json update runs under an exclusive file lock.
+# Locks are re-entrant within a thread so locked helpers can call each other.
+_held_locks = threading.local()
+
+@contextmanager
+def _file_lock(lock_path: str):
+    held = _held_locks.__dict__.setdefault("paths", set())
+    if lock_path in held:
+        yield
+        return
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        held.add(lock_path)
+        try:
+            yield
+        finally:
+            held.discard(lock_path)
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def user_lock(user_id: str):
+    # Keyed on the user id, not the file name, so it survives rename_user_file
+    digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+    return _file_lock(os.path.join(LOCKS_DIR, f"{digest}.lock"))
+
+def index_lock():
+    return _file_lock(os.path.join(LOCKS_DIR, "index.lock"))
+
+def _write_json(path: str, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(tmp, path)
+
+def _file_stat(path: str):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _cached_index() -> dict:
+    stat = _file_stat(INDEX_FILE)
+    if stat is None:
+        ensure_data_dir()
+        stat = _file_stat(INDEX_FILE)
+    with _index_lock:
+        if _index_cache["data"] is not None and _index_cache["stat"] == stat:
+            _index_stats["hits"] += 1
+            return _index_cache["data"]
+        _index_stats["misses"] += 1
     with open(INDEX_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+        data = json.load(f)
+    with _index_lock:
+        _index_cache["data"] = data
+        _index_cache["stat"] = stat
+    return data
+
+@timed("load_index", DB_SECONDS)
+def load_index():
+    storage = get_storage()
+    if storage is not None:
+        return {user_id: storage.get_user_file_path(user_id) for user_id in storage.list_user_ids()}
+    return dict(_cached_index())
 
+@timed("save_index", DB_SECONDS)
 def save_index(index: dict):
-    tmp = INDEX_FILE + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(index, f, ensure_ascii=False, indent=4)
-    os.replace(tmp, INDEX_FILE)
+    with index_lock():
+        _write_json(INDEX_FILE, index)
+    with _index_lock:
+        _index_cache["data"] = dict(index)
+        _index_cache["stat"] = _file_stat(INDEX_FILE)
+
+def index_cache_stats() -> dict:
+    with _index_lock:
+        hits, misses = _index_stats["hits"], _index_stats["misses"]
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else 0.0}
+
+# Short-lived LRU of parsed user documents (without chats), shared by every
+# reader in the process. Entries are also checked against the file's stat so
+# writes from other processes are picked up, and save_user_data writes through.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "2.0"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+_user_lock = threading.Lock()
+_user_cache = OrderedDict()
+_user_stats = {"hits": 0, "misses": 0}
+
+def _remember_user_doc(path: str, data: dict, stat):
+    with _user_lock:
+        _user_cache[path] = (time.monotonic() + USER_CACHE_TTL, stat, data)
+        _user_cache.move_to_end(path)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+
+def _read_user_doc(path: str) -> Optional[dict]:
+    stat = _file_stat(path)
+    if stat is None:
+        return None
+    with _user_lock:
+        entry = _user_cache.get(path)
+        if entry and entry[0] > time.monotonic() and entry[1] == stat:
+            _user_cache.move_to_end(path)
+            _user_stats["hits"] += 1
+            return entry[2]
+        _user_stats["misses"] += 1
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    _remember_user_doc(path, data, stat)
+    return data
+
+def invalidate_user_cache(user_id: Optional[str] = None):
+    with _user_lock:
+        if user_id is None:
+            _user_cache.clear()
+            return
+    path = get_user_file_path(user_id)
+    with _user_lock:
+        _user_cache.pop(path, None)
+
+def user_cache_stats() -> dict:
+    with _user_lock:
+        hits, misses, size = _user_stats["hits"], _user_stats["misses"], len(_user_cache)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "size": size, "hit_ratio": hits / total if total else 0.0}
+
+# Called with a user_id after that user's document or chats were written, e.g. to
+# keep a search index fresh. They run on the writer's thread, so keep them cheap.
+_change_listeners: List[Callable[[str], None]] = []
+
+def add_change_listener(listener: Callable[[str], None]):
+    _change_listeners.append(listener)
+    return listener
+
+def remove_change_listener(listener: Callable[[str], None]):
+    if listener in _change_listeners:
+        _change_listeners.remove(listener)
+
+def _notify_change(user_ids):
+    for listener in list(_change_listeners):
+        for user_id in user_ids:
+            try:
+                listener(user_id)
+            except Exception as e:  # a broken listener must not fail the write
+                print(f"[WARN] Change listener failed for {user_id}: {e}")
+
+def notifies_change(fn):
+    """Runs the change listeners for the user_id argument once `fn` returns"""
+    @functools.wraps(fn)
+    def wrapper(user_id, *args, **kwargs):
+        result = fn(user_id, *args, **kwargs)
+        if _change_listeners:
+            _notify_change([user_id])
+        return result
+    return wrapper
 
 def sanitize_filename(name: str) -> str:
     name = name.strip().lower()
@@ -43,15 +242,28 @@ def user_filename(user_id: str, name: str) -> str:
     filename = f"{safe}_{user_id}.json"
     return os.path.join(USERS_DIR, filename)
 
+@notifies_change
+@timed("create_user_file", DB_SECONDS)
 def create_user_file(user_id: str, name: str, age: Optional[int]=None,
                      weight: Optional[float]=None, height: Optional[float]=None,
                      goal: Optional[str]=None, activity_level: Optional[str]=None) -> str:
+    storage = get_storage()
+    if storage is not None:
+        return storage.create_user_file(user_id, name, age=age, weight=weight, height=height,
+                                        goal=goal, activity_level=activity_level)
     ensure_data_dir()
-    index = load_index()
-    if user_id in index:
-        return index[user_id]
+    with index_lock():
+        index = load_index()
+        if user_id in index:
+            return index[user_id]
 
-    path = user_filename(user_id, name)
+        path = user_filename(user_id, name)
+        _write_new_user_file(path, user_id, name, age, weight, height, goal, activity_level)
+        index[user_id] = path
+        save_index(index)
+    return path
+
+def _write_new_user_file(path, user_id, name, age, weight, height, goal, activity_level):
     initial_data = {
         "user_id": user_id,
         "name": name,
@@ -62,74 +274,247 @@ def create_user_file(user_id: str, name: str, age: Optional[int]=None,
         "activity_level": activity_level,
         "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "language": "en",  
-        "chats": [],
         "nutrition": {}
     }
-    tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(initial_data, f, ensure_ascii=False, indent=4)
-    os.replace(tmp, path)
-
-    index[user_id] = path
-    save_index(index)
-    return path
+    _write_json(path, initial_data)
+    # Chats live in an append-only log next to the user file
+    open(chat_log_path(path), "a", encoding="utf-8").close()
 
 def get_user_file_path(user_id: str) -> Optional[str]:
-    ensure_data_dir()
-    index = load_index()
-    return index.get(user_id)
+    storage = get_storage()
+    if storage is not None:
+        return storage.get_user_file_path(user_id)
+    return _cached_index().get(user_id)
+
+def chat_log_path(user_path: str) -> str:
+    return os.path.splitext(user_path)[0] + ".chats.jsonl"
+
+def _read_chat_lines(lines) -> list:
+    chats = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            chats.append(json.loads(line))
+        except json.JSONDecodeError:
+            # A torn write at the end of the log; skip it
+            continue
+    return chats
 
-def load_user_data(user_id: str) -> Optional[dict]:
+def _tail_lines(path: str, limit: int, block_size: int = 8192) -> list:
+    # Read backwards until we have `limit` complete lines, so the cost
+    # depends on the size of the tail, not on the whole history
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b""
+        while end > 0 and data.count(b"\n") <= limit:
+            start = max(0, end - block_size)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+    lines = data.split(b"\n")
+    if end > 0:
+        lines = lines[1:]  # first piece may be a partial line
+    lines = [line.decode("utf-8") for line in lines if line.strip()]
+    return lines[-limit:]
+
+@timed("load_user_data", DB_SECONDS)
+def load_user_data(user_id: str, include_chats: bool = True) -> Optional[dict]:
+    storage = get_storage()
+    if storage is not None:
+        return storage.load_user_data(user_id, include_chats)
     path = get_user_file_path(user_id)
-    if not path or not os.path.exists(path):
+    if not path:
         return None
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    cached = _read_user_doc(path)
+    if cached is None:
+        return None
+    # Callers are free to mutate what they get back
+    data = copy.deepcopy(cached)
+    log_path = chat_log_path(path)
+    if include_chats and os.path.exists(log_path):
+        with open(log_path, "r", encoding="utf-8") as f:
+            data["chats"] = _read_chat_lines(f)
+    elif not include_chats:
+        data.pop("chats", None)
+    return data
 
+@notifies_change
+@timed("save_user_data", DB_SECONDS)
 def save_user_data(user_id: str, data: dict) -> bool:
-    path = get_user_file_path(user_id)
-    if not path:
-        return False
-    tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-    os.replace(tmp, path)
+    storage = get_storage()
+    if storage is not None:
+        return storage.save_user_data(user_id, data)
+    with user_lock(user_id):
+        path = get_user_file_path(user_id)
+        if not path:
+            return False
+        if "chats" in data and os.path.exists(chat_log_path(path)):
+            # Chats are owned by the log once it exists; use add_chat to add them
+            data = {k: v for k, v in data.items() if k != "chats"}
+        _write_json(path, data)
+        _remember_user_doc(path, copy.deepcopy(data), _file_stat(path))
     return True
 
-def add_chat(user_id: str, user_message: str, bot_response: str):
-    data = load_user_data(user_id)
-    if data is None:
-        create_user_file(user_id, "unknown")
-        data = load_user_data(user_id)
+@notifies_change
+@timed("update_user_data", DB_SECONDS)
+def update_user_data(user_id: str, mutate: Callable[[dict], Optional[bool]]) -> Optional[dict]:
+    """
+    Atomic read-modify-write of a user document. `mutate` changes the dict in
+    place (return False to skip the write). Concurrent updates from other
+    threads or worker processes are serialized, so none of them is lost.
+    """
+    storage = get_storage()
+    if storage is not None:
+        return storage.update_user_data(user_id, mutate)
+    with user_lock(user_id):
+        path = get_user_file_path(user_id)
+        if not path or not os.path.exists(path):
+            return None
+        # Read straight from disk: the cached copy may predate another worker's write
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if os.path.exists(chat_log_path(path)):
+            data.pop("chats", None)
+        if mutate(data) is not False:
+            # The undecorated save: update_user_data notifies the listeners itself
+            save_user_data.__wrapped__(user_id, data)
+        return data
+
+def list_user_ids() -> list:
+    storage = get_storage()
+    if storage is not None:
+        return storage.list_user_ids()
+    return sorted(load_index())
+
+@timed("load_all_users", DB_SECONDS)
+def load_all_users() -> Dict[str, dict]:
+    """Every user document without chats, keyed by user_id"""
+    storage = get_storage()
+    if storage is not None:
+        return storage.load_all_users()
+    users = {}
+    for user_id in list_user_ids():
+        data = load_user_data(user_id, include_chats=False)
+        if data is not None:
+            users[user_id] = data
+    return users
 
-    data.setdefault("chats", []).append({
+@timed("update_many_user_data", DB_SECONDS)
+def update_many_user_data(mutations: Dict[str, Callable[[dict], Optional[bool]]]) -> int:
+    """
+    update_user_data for many users at once; returns how many were written.
+    SQLite applies them in a single transaction, the JSON files one by one.
+    """
+    storage = get_storage()
+    if storage is not None:
+        written = storage.update_many(mutations)
+        if _change_listeners:
+            _notify_change(list(mutations))
+        return written
+    written = 0
+    for user_id, mutate in mutations.items():
+        wrote = []
+
+        def apply(data, mutate=mutate):
+            wrote.append(mutate(data) is not False)
+            return wrote[-1]
+
+        update_user_data(user_id, apply)
+        written += sum(wrote)
+    return written
+
+def migrate_user_chats(user_id: str) -> int:
+    """Move chats embedded in a user file into its append-only chat log."""
+    with user_lock(user_id):
+        path = get_user_file_path(user_id)
+        if not path or not os.path.exists(path):
+            return 0
+        log_path = chat_log_path(path)
+        if os.path.exists(log_path):
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        chats = data.pop("chats", [])
+        tmp = log_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for chat in chats:
+                f.write(json.dumps(chat, ensure_ascii=False) + "\n")
+        os.replace(tmp, log_path)
+        save_user_data(user_id, data)
+        return len(chats)
+
+def migrate_all_chats() -> dict:
+    migrated = {}
+    for user_id in load_index():
+        migrated[user_id] = migrate_user_chats(user_id)
+    return migrated
+
+@notifies_change
+@timed("add_chat", DB_SECONDS)
+def add_chat(user_id: str, user_message: str, bot_response: str):
+    storage = get_storage()
+    if storage is not None:
+        return storage.add_chat(user_id, user_message, bot_response)
+    chat = {
         "user": user_message,
         "bot": bot_response,
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    })
-    save_user_data(user_id, data)
+    }
+    line = json.dumps(chat, ensure_ascii=False) + "\n"
+    with user_lock(user_id):
+        path = get_user_file_path(user_id)
+        if not path or not os.path.exists(path):
+            path = create_user_file(user_id, "unknown")
+        log_path = chat_log_path(path)
+        if not os.path.exists(log_path):
+            migrate_user_chats(user_id)
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(line)
 
-def get_chats(user_id: str):
-    data = load_user_data(user_id)
-    if not data:
+@timed("get_chats", DB_SECONDS)
+def get_chats(user_id: str, limit: Optional[int] = None):
+    storage = get_storage()
+    if storage is not None:
+        return storage.get_chats(user_id, limit)
+    path = get_user_file_path(user_id)
+    if not path or not os.path.exists(path):
         return []
-    return data.get("chats", [])
+    log_path = chat_log_path(path)
+    if not os.path.exists(log_path):
+        # Not migrated yet: chats are still inside the user file
+        data = load_user_data(user_id)
+        chats = data.get("chats", []) if data else []
+        return chats[-limit:] if limit else chats
+    if limit:
+        return _read_chat_lines(_tail_lines(log_path, limit))
+    with open(log_path, "r", encoding="utf-8") as f:
+        return _read_chat_lines(f)
 
+@notifies_change
+@timed("rename_user_file", DB_SECONDS)
 def rename_user_file(user_id: str, new_name: str) -> Optional[str]:
-    path = get_user_file_path(user_id)
-    if not path or not os.path.exists(path):
-        return None
-    new_path = user_filename(user_id, new_name)
-    if os.path.exists(new_path):
-        os.remove(new_path)
-    os.replace(path, new_path)
-    index = load_index()
-    index[user_id] = new_path
-    save_index(index)
-    data = load_user_data(user_id)
-    if data:
-        data["name"] = new_name
-        save_user_data(user_id, data)
+    storage = get_storage()
+    if storage is not None:
+        return storage.rename_user_file(user_id, new_name)
+    with user_lock(user_id), index_lock():
+        path = get_user_file_path(user_id)
+        if not path or not os.path.exists(path):
+            return None
+        new_path = user_filename(user_id, new_name)
+        if os.path.exists(new_path):
+            os.remove(new_path)
+        os.replace(path, new_path)
+        with _user_lock:
+            _user_cache.pop(path, None)
+        if os.path.exists(chat_log_path(path)):
+            os.replace(chat_log_path(path), chat_log_path(new_path))
+        index = load_index()
+        index[user_id] = new_path
+        save_index(index)
+        update_user_data(user_id, lambda data: data.update(name=new_name))
     return new_path
 
 def validate_inputs(weight, height, age, gender, activity_level, goal, surplus=400):
@@ -157,17 +542,26 @@ def calculate_bmr(weight, height, age, gender):
     else:
         raise ValueError("Gender must be 'male' or 'female'")
 
+# Shared with nutrition_bulk.py; bump NUTRITION_VERSION when changing either table
+ACTIVITY_FACTORS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "moderate": 1.55,
+    "very_active": 1.725,
+    "extra_active": 1.9,
+}
+
+# protein, carbs, fat shares of the goal calories
+MACRO_SPLITS = {
+    "loss": (0.40, 0.30, 0.30),
+    "gain": (0.35, 0.40, 0.25),
+    "maintenance": (0.30, 0.40, 0.30),
+}
+
 def calculate_tdee(bmr, activity_level):
-    factors = {
-        "sedentary": 1.2,
-        "light": 1.375,
-        "moderate": 1.55,
-        "very_active": 1.725,
-        "extra_active": 1.9,
-    }
-    if activity_level not in factors:
+    if activity_level not in ACTIVITY_FACTORS:
         raise ValueError("Invalid activity level")
-    return bmr * factors[activity_level]
+    return bmr * ACTIVITY_FACTORS[activity_level]
 
 def adjust_calories_for_goal(tdee, goal, surplus=400):
     goal = goal.lower()
@@ -183,22 +577,16 @@ def adjust_calories_for_goal(tdee, goal, surplus=400):
         raise ValueError("Goal must be 'loss', 'gain', or 'maintenance'")
 
 def calculate_macros(total_calories, goal):
-    goal = goal.lower()
-    if goal == "loss":
-        split = {"protein": 0.40, "carbs": 0.30, "fat": 0.30}
-    elif goal == "gain":
-        split = {"protein": 0.35, "carbs": 0.40, "fat": 0.25}
-    else:  
-        split = {"protein": 0.30, "carbs": 0.40, "fat": 0.30}
+    protein, carbs, fat = MACRO_SPLITS.get(goal.lower(), MACRO_SPLITS["maintenance"])
 
     return {
-        "protein_g": round((total_calories * split["protein"]) / 4),
-        "carbs_g": round((total_calories * split["carbs"]) / 4),
-        "fat_g": round((total_calories * split["fat"]) / 9),
+        "protein_g": round((total_calories * protein) / 4),
+        "carbs_g": round((total_calories * carbs) / 4),
+        "fat_g": round((total_calories * fat) / 9),
     }
 
-def calculate_nutrition(user_id: str):
-    data = load_user_data(user_id)
+def compute_nutrition(data: Optional[dict]):
+    """Nutrition results for a user document, or an error message string."""
     if not data or not all([data.get("weight"), data.get("height"), data.get("age"), data.get("gender"), data.get("activity_level"), data.get("goal")]):
         return "Please provide all required data (weight, height, age, gender, activity level, goal)"
 
@@ -224,13 +612,103 @@ def calculate_nutrition(user_id: str):
             "Goal": goal.capitalize(),
             "Macros": macros
         }
-        data["nutrition"] = results
-        save_user_data(user_id, data)
         return results
     except ValueError as e:
         return str(e)
 
-if __name__ == "__main__":
+# Bump when a formula, activity factor or macro split changes so stored results go stale
+NUTRITION_VERSION = 1
+NUTRITION_INPUTS = ("weight", "height", "age", "gender", "activity_level", "goal", "surplus")
+
+def nutrition_fingerprint(data: dict) -> str:
+    """Hash of everything compute_nutrition reads, stored next to the result."""
+    inputs = {field: data.get(field) for field in NUTRITION_INPUTS}
+    inputs["surplus"] = data.get("surplus", 400)
+    inputs["version"] = NUTRITION_VERSION
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def has_fresh_nutrition(data: dict) -> bool:
+    return bool(data.get("nutrition")) and data.get("nutrition_fingerprint") == nutrition_fingerprint(data)
+
+def calculate_nutrition(user_id: str):
+    outcome = {}
+
+    def apply(data):
+        if has_fresh_nutrition(data):
+            outcome["results"] = data["nutrition"]
+            return False
+        outcome["results"] = compute_nutrition(data)
+        if not isinstance(outcome["results"], dict):
+            return False
+        data["nutrition"] = outcome["results"]
+        data["nutrition_fingerprint"] = nutrition_fingerprint(data)
+
+    if update_user_data(user_id, apply) is None:
+        return compute_nutrition(None)
+    return outcome["results"]
+
+def get_nutrition(user_id: str):
+    """
+    Stored nutrition results when their inputs haven't changed since they were
+    computed; otherwise recomputes and saves them. The common read path is a
+    cached document read with no lock and no write.
+    """
+    data = load_user_data(user_id, include_chats=False)
+    if data and has_fresh_nutrition(data):
+        return data["nutrition"]
+    return calculate_nutrition(user_id)
+
+def _stress_worker(args):
+    user_id, worker, writes = args
+    for i in range(writes):
+        add_chat(user_id, f"worker {worker} message {i}", "ok")
+        update_user_data(user_id, lambda data: data.update(counter=data.get("counter", 0) + 1))
+
+def stress_test(processes: int = 8, writes: int = 50, user_id: str = "stress_test_user") -> bool:
+    """Hammer one user from several processes and check that no write was lost."""
+    from multiprocessing import Pool
+    create_user_file(user_id, "stress test")
+    before_chats = len(get_chats(user_id))
+    before_counter = load_user_data(user_id, include_chats=False).get("counter", 0)
+    started = time.perf_counter()
+    with Pool(processes) as pool:
+        pool.map(_stress_worker, [(user_id, w, writes) for w in range(processes)])
+    elapsed = time.perf_counter() - started
+    invalidate_user_cache()
+    chats = len(get_chats(user_id)) - before_chats
+    counter = load_user_data(user_id, include_chats=False).get("counter", 0) - before_counter
+    expected = processes * writes
+    print(f"{processes} processes x {writes} writes in {elapsed:.2f}s: "
+          f"{chats}/{expected} chats, {counter}/{expected} counter updates")
+    return chats == expected and counter == expected
+
+if __name__ == "__main__" and sys.argv[1:2] == ["stress"]:
+    # python db.py stress [processes] [writes per process]
+    # Runs against a throwaway data dir unless DATA_DIR is set explicitly
+    if "DATA_DIR" not in os.environ:
+        import tempfile
+        os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="dietitian_stress_")
+        print(f"Using temporary data dir {os.environ['DATA_DIR']}")
+        import db as _db
+    else:
+        _db = sys.modules[__name__]
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    writes = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    ok = _db.stress_test(processes, writes)
+    print("✅ No lost writes" if ok else "❌ Lost writes detected")
+    sys.exit(0 if ok else 1)
+elif __name__ == "__main__" and sys.argv[1:2] == ["migrate-sqlite"]:
+    # python db.py migrate-sqlite [path/to/users.db]
+    from storage import SQLiteStorage, migrate_json_to_sqlite
+    target = sys.argv[2] if len(sys.argv) > 2 else SQLITE_PATH
+    result = migrate_json_to_sqlite(SQLiteStorage(target), USERS_DIR)
+    print(f"Imported {result['imported']} users ({result['chats']} chats) into {target}, "
+          f"skipped {result['skipped']} already present")
+elif __name__ == "__main__" and sys.argv[1:] == ["migrate-chats"]:
+    # python db.py migrate-chats
+    migrated = migrate_all_chats()
+    print(f"Migrated {sum(migrated.values())} chats for {len(migrated)} users to append-only logs")
+elif __name__ == "__main__":
     print("=== Dietitian: Your Nutrition Assistant ===")
     print("Welcome to Dietitian! I'm your smart assistant designed to guide you step-by-step in your health journey...")
 
@@ -238,7 +716,7 @@ if __name__ == "__main__":
     name = input("Enter your name: ").strip()
     create_user_file(user_id, name)
 
-    data = load_user_data(user_id)
+    data = load_user_data(user_id, include_chats=False)
     data["weight"] = float(input("Enter weight (kg): "))
     data["height"] = float(input("Enter height (cm): "))
     data["age"] = int(input("Enter age (years): "))
@@ -0,0 +1,230 @@
+import os
+import json
+import hashlib
+import logging
+import re
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from db import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_DIR = os.path.join(DATA_DIR, "embeddings")
+# Appended segment files are folded into the main .npy once there are this many
+COMPACT_SEGMENTS = 32
+
+
+def content_key(model_name: str, text: str) -> str:
+    """Hash of the embedding model name and the exact document text."""
+    return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingIndex:
+    """
+    On-disk store of document embeddings keyed by content_key().
+
+    Vectors live in a float32 .npy matrix next to a JSON list of keys, so a
+    restart loads every known vector with one read and only texts that were
+    added or edited since the last run have to go through the model.
+
+    Saves only write what changed: each batch of new vectors (or of removed
+    keys) goes to its own small segment file, and the segments are folded
+    back into the main file once there are COMPACT_SEGMENTS of them or
+    removed rows outnumber the live ones.
+    """
+
+    def __init__(self, model_name: str, directory: str = EMBEDDINGS_DIR):
+        self.model_name = model_name
+        safe = re.sub(r"[^\w\-]", "_", model_name)
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, f"{safe}.npy")
+        self.keys_path = os.path.join(directory, f"{safe}.keys.json")
+        self._segment_prefix = f"{safe}.seg."
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        # Rows [0, _size) are in use, including rows of removed keys until the next compaction
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._segments: List[str] = []
+        self._load()
+
+    def _reset(self, keys: List[str], matrix: Optional[np.ndarray]):
+        self._matrix = None if matrix is None else matrix.astype(np.float32, copy=False)
+        self._size = len(keys)
+        self._rows = {key: i for i, key in enumerate(keys)}
+
+    def _append(self, keys: List[str], vectors: np.ndarray):
+        """Adds rows, growing the matrix geometrically so appends are amortized O(new rows)"""
+        if not keys:
+            return
+        needed = self._size + len(keys)
+        if self._matrix is None or needed > len(self._matrix):
+            capacity = max(needed, 2 * (0 if self._matrix is None else len(self._matrix)), 64)
+            grown = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            if self._size:
+                grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+        self._matrix[self._size:needed] = vectors
+        for offset, key in enumerate(keys):
+            self._rows[key] = self._size + offset
+        self._size = needed
+
+    def _segment_names(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        # time_ns() leads the name, so sorting replays the segments in the order they were written
+        return sorted(name[:-len(".json")] for name in os.listdir(self.directory)
+                      if name.startswith(self._segment_prefix) and name.endswith(".json"))
+
+    def _load(self):
+        if os.path.exists(self.vectors_path) and os.path.exists(self.keys_path):
+            try:
+                with open(self.keys_path, "r", encoding="utf-8") as f:
+                    keys = json.load(f)
+                matrix = np.load(self.vectors_path)
+                if len(keys) != matrix.shape[0]:
+                    raise ValueError("keys and vectors are out of sync")
+                self._reset(keys, matrix)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable embedding index {self.vectors_path}: {str(e)}")
+        for name in self._segment_names():
+            path = os.path.join(self.directory, name)
+            try:
+                with open(f"{path}.json", "r", encoding="utf-8") as f:
+                    segment = json.load(f)
+                vectors = np.load(f"{path}.npy") if segment["keys"] else None
+                if vectors is not None and len(segment["keys"]) != vectors.shape[0]:
+                    raise ValueError("keys and vectors are out of sync")
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable embedding segment {path}: {str(e)}")
+                continue
+            for key in segment["removed"]:
+                self._rows.pop(key, None)
+            self._append(segment["keys"], vectors)
+            self._segments.append(name)
+        if self._rows:
+            logger.info(f"Loaded {len(self._rows)} cached embeddings for {self.model_name} "
+                        f"({len(self._segments)} segments)")
+
+    def _write_segment(self, keys: List[str], vectors: Optional[np.ndarray], removed: List[str]):
+        """Persists one change; the .json is written last, so a segment without it is ignored"""
+        os.makedirs(self.directory, exist_ok=True)
+        # Unique names, so processes saving at the same time don't write into each other's file
+        name = f"{self._segment_prefix}{time.time_ns():020d}.{os.getpid()}.{uuid.uuid4().hex[:8]}"
+        path = os.path.join(self.directory, name)
+        if keys:
+            np.save(f"{path}.tmp.npy", vectors)
+            os.replace(f"{path}.tmp.npy", f"{path}.npy")
+        with open(f"{path}.json.tmp", "w", encoding="utf-8") as f:
+            json.dump({"keys": keys, "removed": removed}, f)
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+        self._segments.append(name)
+        if len(self._segments) >= COMPACT_SEGMENTS or self._size - len(self._rows) > len(self._rows):
+            self._compact()
+
+    def _compact(self):
+        """Rewrites the main file with the live rows and deletes the segments folded into it"""
+        os.makedirs(self.directory, exist_ok=True)
+        live = sorted(self._rows.items(), key=lambda item: item[1])
+        keys = [key for key, _ in live]
+        if self._matrix is None:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        else:
+            matrix = self._matrix[[i for _, i in live]]
+        suffix = f"{os.getpid()}.{uuid.uuid4().hex}"
+        tmp = f"{self.vectors_path}.{suffix}.tmp.npy"
+        np.save(tmp, matrix)
+        os.replace(tmp, self.vectors_path)
+        tmp = f"{self.keys_path}.{suffix}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(keys, f)
+        os.replace(tmp, self.keys_path)
+        for name in self._segments:
+            for extension in (".json", ".npy"):
+                try:
+                    os.remove(os.path.join(self.directory, name + extension))
+                except FileNotFoundError:
+                    pass
+        self._segments = []
+        self._reset(keys, matrix if self._matrix is not None else None)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def embed(self, texts: List[str], embed_fn: Callable[[List[str]], List[List[float]]]) -> np.ndarray:
+        """
+        Returns a (len(texts), dim) float32 matrix, calling embed_fn once with
+        only the texts that are not in the index yet.
+        """
+        keys = [content_key(self.model_name, t) for t in texts]
+        with self._lock:
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self._rows and key not in missing:
+                    missing[key] = text
+            if missing:
+                logger.info(f"Embedding {len(missing)} new or changed documents with {self.model_name}")
+                new_vectors = np.asarray(embed_fn(list(missing.values())), dtype=np.float32)
+                self._append(list(missing), new_vectors)
+                self._write_segment(list(missing), new_vectors, [])
+            if not keys:
+                return np.zeros((0, 0 if self._matrix is None else self._matrix.shape[1]), dtype=np.float32)
+            return self._matrix[[self._rows[key] for key in keys]]
+
+    def _discard(self, keys: Iterable[str]) -> int:
+        removed = [key for key in dict.fromkeys(keys) if self._rows.pop(key, None) is not None]
+        if removed:
+            self._write_segment([], None, removed)
+        return len(removed)
+
+    def discard(self, keys: Iterable[str]) -> int:
+        """Drops the vectors stored under these content keys; returns the number removed."""
+        with self._lock:
+            return self._discard(keys)
+
+    def prune(self, keep_texts: List[str]) -> int:
+        """Drops vectors whose text is no longer in keep_texts; returns the number removed."""
+        keep = {content_key(self.model_name, t) for t in keep_texts}
+        with self._lock:
+            return self._discard([key for key in self._rows if key not in keep])
+
+
+class CachedEmbeddings:
+    """
+    LangChain-compatible embeddings wrapper backed by an EmbeddingIndex.
+
+    `factory` builds the real embedding model; it is only called the first
+    time something actually needs embedding (a cache miss or a query).
+    """
+
+    def __init__(self, model_name: str, factory: Callable[[], object], directory: str = EMBEDDINGS_DIR):
+        self.model_name = model_name
+        self.index = EmbeddingIndex(model_name, directory)
+        self._factory = factory
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = self._factory()
+        return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.index.embed(texts, lambda missing: self.model.embed_documents(missing)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeds many queries in one model call; like embed_query, results aren't cached."""
+        if not texts:
+            return []
+        return self.model.embed_documents(list(texts))
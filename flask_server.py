@@ -1,12 +1,21 @@
 # app.py - Flask Backend for Nutrition Chatbot
+import time
+STARTED = time.perf_counter()  # cold-start time is measured from here
 import os
 import io
+import hmac
+import json
 import logging
-from flask import Flask, request, jsonify, render_template_string, send_from_directory
+import socket
+import threading
+from flask import Flask, Response, g, request, jsonify, render_template_string, send_from_directory, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import chatbot
 import db
+import metrics
+import nutrition_bulk
+from meal_planner import targets_from_nutrition
 import traceback
 
 # Configure logging
@@ -20,12 +29,85 @@ CORS(app)  # Enable CORS for cross-origin requests
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'wav', 'mp3', 'ogg', 'webm'}
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '1000'))
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+# Send this header (any value) to get a per-request timing breakdown in JSON responses
+DEBUG_TIMING_HEADER = 'X-Debug-Timing'
+# WARM_UP=1 loads Gemini, the food index and the embedding model in a background
+# thread once the server is accepting connections, instead of on the first chat
+WARM_UP = os.getenv('WARM_UP', '0') == '1'
+
+# Cache hit ratios reported by /api/metrics
+metrics.register_cache('index', db.index_cache_stats)
+metrics.register_cache('user', db.user_cache_stats)
+metrics.register_cache('response', chatbot.response_cache.stats)
+metrics.register_cache('image', chatbot.image_cache.stats)
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs('data', exist_ok=True)
 os.makedirs('data/users', exist_ok=True)
 
+# disabled -> pending -> running -> ready | failed
+warm_up_state = {'status': 'pending' if WARM_UP else 'disabled', 'seconds': None, 'steps': {},
+                 'error': None, 'ready_after_s': None}
+_warm_up_lock = threading.Lock()
+
+def _wait_for_port(port, timeout=60.0):
+    """Blocks until something accepts connections on localhost:port (or the timeout passes)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def start_warm_up(port=None):
+    """
+    Runs chatbot.warm_up() in a daemon thread, after localhost:port accepts
+    connections when a port is given. Returns None if it was started already.
+    """
+    with _warm_up_lock:
+        if warm_up_state['status'] not in ('pending', 'failed'):
+            return None
+        warm_up_state.update(status='running', error=None)
+
+    def run():
+        if port is not None:
+            _wait_for_port(port)
+        started = time.perf_counter()
+        try:
+            steps = chatbot.warm_up()
+        except Exception as e:
+            warm_up_state.update(status='failed', error=str(e))
+            print(f"⚠️  Warning: Warm-up failed, loading on first request instead: {e}")
+            return
+        warm_up_state.update(status='ready', steps=steps, seconds=round(time.perf_counter() - started, 3),
+                             ready_after_s=round(time.perf_counter() - STARTED, 3))
+        breakdown = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in steps.items())
+        print(f"✅ Warm-up finished in {warm_up_state['seconds']:.2f}s ({breakdown}); "
+              f"ready {warm_up_state['ready_after_s']:.2f}s after start")
+
+    thread = threading.Thread(target=run, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+# What a text chat needs; Gemini vision only loads for image requests, so it is reported but not awaited
+TEXT_PATH_COMPONENTS = ('food_index', 'food_table', 'embedding_model')
+
+def readiness():
+    """Whether chat requests will be served without waiting for models to load"""
+    components = chatbot.loaded_components()
+    if warm_up_state['status'] == 'disabled':
+        # Models load on first use by design, so serving at all is as ready as it gets
+        ready = True
+    else:
+        ready = all(components[name] for name in TEXT_PATH_COMPONENTS)
+    return {'ready': ready, 'warm_up': dict(warm_up_state), 'components': components}
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -76,6 +158,39 @@ def validate_user_data(data):
     
     return errors
 
+@app.before_request
+def start_request_metrics():
+    # Under a WSGI server the socket is bound before any request arrives
+    if warm_up_state['status'] == 'pending':
+        start_warm_up()
+    g.metrics_started = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc()
+    if request.headers.get(DEBUG_TIMING_HEADER):
+        g.trace, g.trace_token = metrics.start_trace()
+
+@app.after_request
+def record_request_metrics(response):
+    # The route template, not the path, so user ids don't become label values
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.HTTP_REQUESTS.inc(request.method, endpoint, str(response.status_code))
+    metrics.HTTP_SECONDS.observe(time.perf_counter() - g.metrics_started, endpoint)
+    if response.status_code >= 500:
+        metrics.HTTP_ERRORS.inc(endpoint)
+    trace = g.get('trace')
+    if trace is not None and response.is_json and not response.is_streamed:
+        body = response.get_json(silent=True)
+        if isinstance(body, dict):
+            body['timings'] = trace.summary()
+            response.set_data(app.json.dumps(body))
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    metrics.HTTP_IN_FLIGHT.dec()
+    token = g.pop('trace_token', None)
+    if token is not None:
+        metrics.end_trace(token)
+
 @app.route('/')
 def index():
     """Serve the main HTML page"""
@@ -126,19 +241,39 @@ def test_chatbot():
             'traceback': traceback.format_exc()
         })
 
+@app.route('/api/metrics')
+def prometheus_metrics():
+    """Stage/db latency histograms, request counters and cache hit ratios in Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/health')
 def health_check():
-    """Health check endpoint"""
+    """Liveness (the process answers) plus readiness (models loaded) and startup timings"""
+    state = readiness()
     return jsonify({
         'status': 'healthy',
         'message': 'Dietitian API is running',
+        'live': True,
+        'ready': state['ready'],
+        'readiness': state,
+        'startup': {'import_s': IMPORT_SECONDS, 'ready_after_s': warm_up_state['ready_after_s']},
         'endpoints': {
+            'ready': '/api/health/ready',
             'register': '/api/register',
             'chat': '/api/chat',
+            'chat_stream': '/api/chat/stream',
+            'chat_batch': '/api/chat/batch',
+            'metrics': '/api/metrics',
             'user': '/api/user/<user_id>'
         }
     })
 
+@app.route('/api/health/ready')
+def readiness_check():
+    """Readiness probe: 503 until warm-up has loaded the models"""
+    state = readiness()
+    return jsonify(state), 200 if state['ready'] else 503
+
 @app.route('/api/register', methods=['POST'])
 def register_user():
     """Register a new user or check existing user"""
@@ -161,7 +296,7 @@ def register_user():
         user_id = data['userId'].strip()
         
         # Check if user already exists
-        existing_user = db.load_user_data(user_id)
+        existing_user = db.load_user_data(user_id, include_chats=False)
         if existing_user:
             return jsonify({
                 'success': False, 
@@ -181,12 +316,10 @@ def register_user():
             )
             
             # Update user data with additional fields
-            user_data = db.load_user_data(user_id)
-            user_data.update({
+            db.update_user_data(user_id, lambda user_data: user_data.update({
                 'gender': data['gender'].lower(),
                 'surplus': int(data.get('surplus', 400)) if data['goal'].lower() == 'gain' else 400
-            })
-            db.save_user_data(user_id, user_data)
+            }))
             
             # Calculate nutrition requirements
             nutrition_results = db.calculate_nutrition(user_id)
@@ -214,74 +347,83 @@ def register_user():
             'message': f'Registration failed: {str(e)}'
         }), 500
 
+def parse_chat_request():
+    """Read user, message and uploads from a chat form; returns (payload, error_response)"""
+    user_id = request.form.get('user_id')
+    if not user_id:
+        return None, (jsonify({'success': False, 'message': 'User ID is required'}), 400)
+    
+    # Verify user exists
+    user_data = db.load_user_data(user_id, include_chats=False)
+    if not user_data:
+        return None, (jsonify({
+            'success': False, 
+            'message': 'User not found. Please register first.'
+        }), 404)
+    
+    # Get message content
+    message = request.form.get('message', '').strip()
+    
+    # Handle file uploads
+    image_data = None
+    voice_data = None
+    
+    # Process image upload
+    if 'image' in request.files:
+        image_file = request.files['image']
+        if image_file and image_file.filename and allowed_file(image_file.filename):
+            try:
+                image_data = image_file.read()
+                logger.info(f"Image uploaded for user {user_id}: {len(image_data)} bytes")
+            except Exception as e:
+                logger.error(f"Error reading image: {str(e)}")
+                return None, (jsonify({
+                    'success': False,
+                    'message': 'Failed to process image upload'
+                }), 400)
+    
+    # Process voice upload
+    if 'audio' in request.files:
+        audio_file = request.files['audio']
+        if audio_file and audio_file.filename:
+            try:
+                voice_data = audio_file.read()
+                logger.info(f"Audio uploaded for user {user_id}: {len(voice_data)} bytes")
+            except Exception as e:
+                logger.error(f"Error reading audio: {str(e)}")
+                return None, (jsonify({
+                    'success': False,
+                    'message': 'Failed to process audio upload'
+                }), 400)
+    
+    # Ensure we have some input
+    if not message and not image_data and not voice_data:
+        return None, (jsonify({
+            'success': False,
+            'message': 'Please provide a message, image, or voice input'
+        }), 400)
+    
+    return {
+        'user_id': user_id,
+        'user_input': message if message else None,
+        'image_data': image_data,
+        'voice_data': voice_data
+    }, None
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Handle chat messages with text, image, and voice support"""
     try:
-        user_id = request.form.get('user_id')
-        if not user_id:
-            return jsonify({'success': False, 'message': 'User ID is required'}), 400
-        
-        # Verify user exists
-        user_data = db.load_user_data(user_id)
-        if not user_data:
-            return jsonify({
-                'success': False, 
-                'message': 'User not found. Please register first.'
-            }), 404
-        
-        # Get message content
-        message = request.form.get('message', '').strip()
-        
-        # Handle file uploads
-        image_data = None
-        voice_data = None
-        
-        # Process image upload
-        if 'image' in request.files:
-            image_file = request.files['image']
-            if image_file and image_file.filename and allowed_file(image_file.filename):
-                try:
-                    image_data = image_file.read()
-                    logger.info(f"Image uploaded for user {user_id}: {len(image_data)} bytes")
-                except Exception as e:
-                    logger.error(f"Error reading image: {str(e)}")
-                    return jsonify({
-                        'success': False,
-                        'message': 'Failed to process image upload'
-                    }), 400
-        
-        # Process voice upload
-        if 'audio' in request.files:
-            audio_file = request.files['audio']
-            if audio_file and audio_file.filename:
-                try:
-                    voice_data = audio_file.read()
-                    logger.info(f"Audio uploaded for user {user_id}: {len(voice_data)} bytes")
-                except Exception as e:
-                    logger.error(f"Error reading audio: {str(e)}")
-                    return jsonify({
-                        'success': False,
-                        'message': 'Failed to process audio upload'
-                    }), 400
-        
-        # Ensure we have some input
-        if not message and not image_data and not voice_data:
-            return jsonify({
-                'success': False,
-                'message': 'Please provide a message, image, or voice input'
-            }), 400
+        payload, error = parse_chat_request()
+        if error:
+            return error
+        user_id = payload['user_id']
         
         # Get bot response using your existing chatbot
         logger.info(f"Processing chat request for user {user_id}")
         
         try:
-            bot_response = chatbot.get_bot_response(
-                user_id=user_id,
-                user_input=message if message else None,
-                image_data=image_data,
-                voice_data=voice_data
-            )
+            bot_response = chatbot.get_bot_response(**payload)
             
             logger.info(f"Bot response generated for user {user_id}")
             
@@ -306,15 +448,109 @@ def chat():
             'message': 'An unexpected error occurred'
         }), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Same as /api/chat, but streams the answer as Server-Sent Events"""
+    try:
+        payload, error = parse_chat_request()
+        if error:
+            return error
+    except Exception as e:
+        logger.error(f"Chat stream endpoint error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'An unexpected error occurred'
+        }), 500
+    
+    user_id = payload['user_id']
+    logger.info(f"Streaming chat response for user {user_id}")
+    
+    # The generator runs after this view returns; keep recording into the request's trace
+    trace = metrics.current_trace()
+    
+    def events():
+        # chatbot.stream_bot_response saves the full answer once it is done
+        try:
+            with metrics.tracing(trace):
+                for chunk in chatbot.stream_bot_response(**payload):
+                    if isinstance(chunk, chatbot.ChatError):
+                        logger.error(f"Chatbot stream error for user {user_id}: {chunk}")
+                        yield f"event: error\ndata: {json.dumps({'success': False, 'message': chunk})}\n\n"
+                        return
+                    yield f"data: {json.dumps({'chunk': chunk}, ensure_ascii=False)}\n\n"
+            done = {'success': True, 'user_id': user_id}
+            if trace is not None:
+                done['timings'] = trace.summary()
+            yield f"event: done\ndata: {json.dumps(done)}\n\n"
+        except Exception as e:
+            logger.error(f"Chatbot stream error for user {user_id}: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'success': False, 'message': str(e)})}\n\n"
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """
+    Answer many text messages in one call, e.g. scheduled check-ins.
+    Body: {"items": [{"user_id": "...", "message": "..."}], "concurrency": 8}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        items = data.get('items')
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                'success': False,
+                'message': 'items must be a non-empty list of {user_id, message}'
+            }), 400
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({
+                'success': False,
+                'message': f'At most {BATCH_MAX_ITEMS} items per batch'
+            }), 400
+        if not all(isinstance(item, dict) for item in items):
+            return jsonify({
+                'success': False,
+                'message': 'Each item must be an object with user_id and message'
+            }), 400
+        
+        concurrency = data.get('concurrency')
+        if concurrency is not None and (not isinstance(concurrency, int) or concurrency < 1):
+            return jsonify({
+                'success': False,
+                'message': 'concurrency must be a positive integer'
+            }), 400
+        
+        pairs = [(str(item.get('user_id') or ''), str(item.get('message') or '')) for item in items]
+        logger.info(f"Processing chat batch of {len(pairs)} messages")
+        results = chatbot.get_bot_responses_batch(pairs, max_concurrency=concurrency)
+        failed = sum(1 for result in results if 'error' in result)
+        
+        return jsonify({
+            'success': failed == 0,
+            'count': len(results),
+            'failed': failed,
+            'results': results
+        })
+    
+    except Exception as e:
+        logger.error(f"Chat batch endpoint error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'An unexpected error occurred'
+        }), 500
+
 @app.route('/api/user/<user_id>')
 def get_user(user_id):
     """Get user information and chat history"""
     try:
-        user_data = db.load_user_data(user_id)
+        user_data = db.load_user_data(user_id, include_chats=False)
         if not user_data:
             return jsonify({'success': False, 'message': 'User not found'}), 404
         
-        chats = db.get_chats(user_id)
+        chats = db.get_chats(user_id, limit=10)
         
         # Remove sensitive data before sending
         safe_user_data = {
@@ -329,7 +565,7 @@ def get_user(user_id):
         return jsonify({
             'success': True,
             'user': safe_user_data,
-            'chats': chats[-10:]  # Return last 10 chats
+            'chats': chats  # Last 10 chats
         })
     
     except Exception as e:
@@ -343,7 +579,8 @@ def get_user(user_id):
 def get_nutrition(user_id):
     """Get user's nutrition calculations"""
     try:
-        results = db.calculate_nutrition(user_id)
+        # Only writes when the profile changed since the results were stored
+        results = db.get_nutrition(user_id)
         if isinstance(results, str):  # Error message
             return jsonify({'success': False, 'message': results}), 400
         
@@ -359,6 +596,64 @@ def get_nutrition(user_id):
             'message': 'Failed to calculate nutrition'
         }), 500
 
+@app.route('/api/meal-plan/<user_id>', methods=['POST'])
+def meal_plan(user_id):
+    """
+    Build a day of meals that hits the user's calorie and macro targets.
+    Body (optional): {"exclude": ["pork"], "prefer": ["rice"], "max_items": 8}
+    """
+    try:
+        nutrition = db.get_nutrition(user_id)
+        if isinstance(nutrition, str):  # Error message
+            return jsonify({'success': False, 'message': nutrition}), 400
+        
+        data = request.get_json(silent=True) or {}
+        exclude = data.get('exclude') or []
+        prefer = data.get('prefer') or []
+        if not isinstance(exclude, list) or not isinstance(prefer, list):
+            return jsonify({'success': False, 'message': 'exclude and prefer must be lists'}), 400
+        max_items = data.get('max_items', 8)
+        if not isinstance(max_items, int) or not 1 <= max_items <= 20:
+            return jsonify({'success': False, 'message': 'max_items must be between 1 and 20'}), 400
+        
+        planner = chatbot.get_runtime().meal_planner
+        plan = planner.plan(targets_from_nutrition(nutrition), exclude=[str(x) for x in exclude],
+                            prefer=[str(x) for x in prefer], max_items=max_items)
+        return jsonify({
+            'success': True,
+            'plan': plan.to_dict(),
+            'text': plan.to_text()
+        })
+    
+    except Exception as e:
+        logger.error(f"Error building meal plan for {user_id}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to build meal plan'
+        }), 500
+
+@app.route('/api/admin/nutrition/recompute', methods=['POST'])
+def recompute_nutrition():
+    """Recompute every user's nutrition in one vectorized pass (requires X-Admin-Token)"""
+    if not ADMIN_TOKEN:
+        return jsonify({'success': False, 'message': 'Admin endpoints are disabled'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({'success': False, 'message': 'Invalid admin token'}), 401
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        summary = nutrition_bulk.recompute_all(dry_run=bool(data.get('dry_run', False)))
+        logger.info(f"Bulk nutrition recompute: {summary}")
+        return jsonify({'success': True, 'summary': summary})
+    
+    except Exception as e:
+        logger.error(f"Bulk nutrition recompute error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'An unexpected error occurred',
+            'error': str(e)
+        }), 500
+
 @app.errorhandler(413)
 def too_large(e):
     """Handle file too large error"""
@@ -384,6 +679,9 @@ def internal_error(e):
         'message': 'Internal server error'
     }), 500
 
+# Seconds from the first import to a usable app, printed at startup and in /api/health
+IMPORT_SECONDS = round(time.perf_counter() - STARTED, 3)
+
 if __name__ == '__main__':
     print("=" * 50)
     print("🌱 DIETITIAN - AI NUTRITION COACH")
@@ -400,4 +698,12 @@ if __name__ == '__main__':
     if missing_files:
         print(f"⚠️  Warning: Missing files: {missing_files}")
     
+    print(f"⏱️  App loaded in {IMPORT_SECONDS:.2f}s")
+    # The debug reloader's parent process only watches files; the child serves
+    if WARM_UP and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warm_up(port=5000)
+        print("🔥 Warming up in the background; /api/health/ready reports when it is done")
+    elif not WARM_UP:
+        print("💤 Models load on the first chat request (set WARM_UP=1 to preload them)")
+    
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
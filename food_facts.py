@@ -0,0 +1,221 @@
+import re
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+NUTRIENT_COLUMNS = ["Calories", "Protein", "Fat", "Carbohydrates", "Nutrition Density"]
+
+NUTRIENT_UNITS = {
+    "Calories": "kcal",
+    "Protein": "g",
+    "Fat": "g",
+    "Carbohydrates": "g",
+    "Nutrition Density": "",
+}
+
+NUTRIENT_EMOJIS = {
+    "Calories": "🔥",
+    "Protein": "🍗",
+    "Fat": "🧈",
+    "Carbohydrates": "🍞",
+    "Nutrition Density": "🥦",
+}
+
+# Words users type for each column
+NUTRIENT_ALIASES = {
+    "calorie": "Calories", "calories": "Calories", "kcal": "Calories", "cals": "Calories",
+    "protein": "Protein", "proteins": "Protein",
+    "fat": "Fat", "fats": "Fat",
+    "carb": "Carbohydrates", "carbs": "Carbohydrates",
+    "carbohydrate": "Carbohydrates", "carbohydrates": "Carbohydrates",
+    "nutrition density": "Nutrition Density", "nutrient density": "Nutrition Density",
+    "density": "Nutrition Density",
+}
+
+_NUTRIENT_RE = "|".join(sorted((re.escape(a) for a in NUTRIENT_ALIASES), key=len, reverse=True))
+
+# Each pattern captures the nutrient word(s) and the food name
+_INTENT_PATTERNS = [
+    re.compile(rf"^how (?:many|much) (?P<nutrients>{_NUTRIENT_RE})(?: are| is)?(?: there)? (?:in|does|do|on) (?P<food>.+?)(?: have| has| contain| contains)?$"),
+    re.compile(rf"^(?:what is|what's|whats|what are|tell me|show me|give me)? ?(?:the )?(?P<nutrients>(?:{_NUTRIENT_RE})(?:(?:,| and|,? &) (?:{_NUTRIENT_RE}))*)(?: content| count| value| amount)? (?:in|of|for) (?P<food>.+)$"),
+    re.compile(r"^(?:what is|what's|whats|what are|show me|give me)? ?(?:the )?(?:nutrition|nutritional|nutrient) (?:facts|info|information|values|breakdown) (?:in|of|for) (?P<food>.+)$"),
+    re.compile(r"^(?P<food>.+?) (?:nutrition|nutritional) (?:facts|info|information|values)$"),
+]
+
+_FOOD_STOPWORDS = re.compile(r"^(?:a|an|the|some|one|1|a piece of|a serving of|a portion of|a slice of|a cup of)\s+")
+# Comparisons and conditions ("... vs ricotta", "... if i am on keto") need the LLM, not a table row
+_NOT_A_LOOKUP = re.compile(r"\b(?:vs|versus|or|compared to|compared with|than|instead of|if|when|while|since|because|"
+                           r"unless|for (?:a|an|my|someone)|on (?:a |the )?(?:keto|diet|cut)|during|after|before)\b")
+# Words in a food name that don't need to appear in the matched row
+_FILLER_TOKENS = {"a", "an", "the", "of", "some", "fresh", "plain"}
+
+
+def normalize_name(text: str) -> str:
+    text = text.lower().strip()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class FoodFactIntent:
+    nutrients: List[str]
+    food: str
+
+
+class FoodTable:
+    """
+    Columnar copy of cleaned_food_data.csv with an exact and a trigram name index.
+
+    Lookups are plain dict and set operations, so answering a direct
+    "how many calories in X" question takes microseconds.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.names: List[str] = df["Food"].astype(str).tolist()
+        self.columns: Dict[str, List[float]] = {
+            column: df[column].tolist() for column in NUTRIENT_COLUMNS if column in df.columns
+        }
+        self._exact: Dict[str, int] = {}
+        self._grams: List[set] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for row, name in enumerate(self.names):
+            key = normalize_name(name)
+            self._exact.setdefault(key, row)
+            grams = trigrams(key)
+            self._grams.append(grams)
+            for gram in grams:
+                self._postings[gram].append(row)
+
+    @classmethod
+    def from_csv(cls, csv_file_path: str = "cleaned_food_data.csv") -> "FoodTable":
+        return cls(pd.read_csv(csv_file_path))
+
+    def __len__(self):
+        return len(self.names)
+
+    def find(self, food: str, min_score: float = 0.55, margin: float = 0.1) -> Optional[Tuple[int, float]]:
+        """
+        Returns (row, score) for the best matching food name, or None.
+        Exact matches score 1.0; otherwise the trigram Dice coefficient is used,
+        and the best candidate must beat the runner-up by `margin` so generic
+        queries ("chicken", "pizza") are left to the LLM instead of guessed.
+        """
+        key = normalize_name(food)
+        if not key:
+            return None
+        if key in self._exact:
+            return self._exact[key], 1.0
+        if key.endswith("s") and key[:-1] in self._exact:
+            return self._exact[key[:-1]], 1.0
+
+        query_grams = trigrams(key)
+        overlap: Dict[int, int] = defaultdict(int)
+        for gram in query_grams:
+            for row in self._postings.get(gram, ()):
+                overlap[row] += 1
+        best_row, best_score, runner_up = None, 0.0, 0.0
+        for row, shared in overlap.items():
+            score = 2.0 * shared / (len(query_grams) + len(self._grams[row]))
+            if score > best_score:
+                best_row, best_score, runner_up = row, score, best_score
+            elif score > runner_up:
+                runner_up = score
+        if best_row is None or best_score < min_score or best_score - runner_up < margin:
+            return None
+        if not self._covers(self.names[best_row], key):
+            return None
+        return best_row, best_score
+
+    @staticmethod
+    def _covers(name: str, key: str, min_token_score: float = 0.6) -> bool:
+        """
+        Every food word of the query appears in the matched name, allowing
+        plurals and small typos, so "cream cheese bagel" does not answer with
+        plain "cream cheese".
+        """
+        name_tokens = [(token, trigrams(token)) for token in normalize_name(name).split()]
+        for token in key.split():
+            if token in _FILLER_TOKENS:
+                continue
+            grams = trigrams(token)
+            if not any(token.rstrip("s") == other.rstrip("s")
+                       or 2.0 * len(grams & other_grams) / (len(grams) + len(other_grams)) >= min_token_score
+                       for other, other_grams in name_tokens):
+                return False
+        return True
+
+    def row(self, row: int) -> Dict[str, object]:
+        return {"Food": self.names[row], **{c: values[row] for c, values in self.columns.items()}}
+
+
+def detect_food_fact_intent(question: str) -> Optional[FoodFactIntent]:
+    """
+    Recognizes direct nutrient lookups such as "how many calories in an apple"
+    or "protein and fat in cheddar cheese". Returns None for anything else.
+    """
+    text = normalize_name(question or "")
+    if not text or len(text) > 120:
+        return None
+    for pattern in _INTENT_PATTERNS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        food = _FOOD_STOPWORDS.sub("", match.group("food").strip())
+        if not food or _NOT_A_LOOKUP.search(food):
+            return None
+        words = match.groupdict().get("nutrients")
+        if words:
+            nutrients = []
+            for alias in re.findall(_NUTRIENT_RE, words):
+                column = NUTRIENT_ALIASES[alias]
+                if column not in nutrients:
+                    nutrients.append(column)
+        else:
+            nutrients = list(NUTRIENT_COLUMNS)
+        return FoodFactIntent(nutrients=nutrients, food=food)
+    return None
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def format_food_fact(row: Dict[str, object], nutrients: List[str]) -> str:
+    lines = [f"🍽️ {str(row['Food']).title()} (from our food database):"]
+    for column in nutrients:
+        if column not in row:
+            continue
+        unit = NUTRIENT_UNITS[column]
+        value = _format_value(row[column])
+        lines.append(f"{NUTRIENT_EMOJIS[column]} {column}: {value}{' ' + unit if unit else ''}")
+    return "\n".join(lines)
+
+
+def answer_food_fact(question: str, table: FoodTable) -> Optional[str]:
+    """
+    Answers a direct nutrient lookup from the food table.
+    Returns None when the question is not a lookup or the food is unknown,
+    in which case the caller should fall through to the LLM chain.
+    """
+    intent = detect_food_fact_intent(question)
+    if intent is None:
+        return None
+    match = table.find(intent.food)
+    if match is None:
+        logger.debug(f"Food fact fast path: no match for '{intent.food}'")
+        return None
+    row, score = match
+    logger.info(f"Food fact fast path answered '{intent.food}' with '{table.names[row]}' (score {score:.2f})")
+    return format_food_fact(table.row(row), intent.nutrients)
@@ -1,9 +1,14 @@
 import sqlite3
+import threading
 from datetime import datetime
 import pickle
+import numpy as np
 
 DB_NAME = "coaching_bot.db"
 
+# Embeddings are stored as raw little-endian float32 bytes
+EMBEDDING_DTYPE = np.dtype("<f4")
+
 # ------------------------------
 # DATABASE INITIALIZATION
 # ------------------------------
@@ -40,10 +45,16 @@ def init_db():
         user_id INTEGER NOT NULL,
         content TEXT NOT NULL,
         embedding BLOB NOT NULL,
+        dim INTEGER,
         timestamp TEXT NOT NULL,
         FOREIGN KEY(user_id) REFERENCES users(id)
     )
     """)
+    # Databases created before embeddings were stored as float32 have no dim column
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(rag_context)")]
+    if "dim" not in columns:
+        cursor.execute("ALTER TABLE rag_context ADD COLUMN dim INTEGER")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_rag_context_user ON rag_context(user_id)")
 
     conn.commit()
     conn.close()
@@ -108,25 +119,108 @@ def get_conversations(user_id):
 # ------------------------------
 # RAG CONTEXT OPERATIONS
 # ------------------------------
+# Per-user (contents, timestamps, L2-normalized matrix), dropped on insert
+_rag_cache = {}
+_rag_cache_lock = threading.Lock()
+# Bumped on every insert (per user) and migration (all users), under _rag_cache_lock.
+# A matrix is only cached if its user's generation didn't move while it was loading.
+_rag_generations = {}
+_rag_epoch = 0
+
+def _rag_generation(user_id):
+    return _rag_epoch, _rag_generations.get(user_id, 0)
+
+def encode_embedding(embedding):
+    vector = np.asarray(embedding, dtype=EMBEDDING_DTYPE).ravel()
+    return vector.tobytes(), vector.shape[0]
+
+def decode_embedding(blob, dim):
+    return np.frombuffer(blob, dtype=EMBEDDING_DTYPE, count=dim)
+
 def add_rag_context(user_id, content, embedding):
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
     timestamp = datetime.utcnow().isoformat()
-    embedding_blob = pickle.dumps(embedding)  # convert embedding to binary
-    cursor.execute("INSERT INTO rag_context (user_id, content, embedding, timestamp) VALUES (?, ?, ?, ?)",
-                   (user_id, content, embedding_blob, timestamp))
+    embedding_blob, dim = encode_embedding(embedding)
+    cursor.execute("INSERT INTO rag_context (user_id, content, embedding, dim, timestamp) VALUES (?, ?, ?, ?, ?)",
+                   (user_id, content, embedding_blob, dim, timestamp))
     conn.commit()
     conn.close()
+    with _rag_cache_lock:
+        _rag_generations[user_id] = _rag_generations.get(user_id, 0) + 1
+        _rag_cache.pop(user_id, None)
 
 def get_rag_context(user_id):
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
-    cursor.execute("SELECT content, embedding, timestamp FROM rag_context WHERE user_id = ?", (user_id,))
+    cursor.execute("SELECT content, embedding, dim, timestamp FROM rag_context WHERE user_id = ? AND dim IS NOT NULL",
+                   (user_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return [(content, decode_embedding(blob, dim).tolist(), timestamp) for content, blob, dim, timestamp in rows]
+
+def _load_rag_matrix(user_id, dim):
+    conn = sqlite3.connect(DB_NAME)
+    cursor = conn.cursor()
+    cursor.execute("SELECT content, embedding, timestamp FROM rag_context WHERE user_id = ? AND dim = ? ORDER BY id",
+                   (user_id, dim))
+    rows = cursor.fetchall()
+    conn.close()
+    contents = [row[0] for row in rows]
+    timestamps = [row[2] for row in rows]
+    # One contiguous buffer -> one (n, dim) matrix, no per-row Python decoding
+    matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=EMBEDDING_DTYPE).reshape(len(rows), dim)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return contents, timestamps, (matrix / norms).astype(np.float32)
+
+def search_rag_context(user_id, query_vec, k=5, use_cache=True):
+    """Top-k (content, cosine similarity, timestamp) of a user's stored context, best first."""
+    query = np.asarray(query_vec, dtype=np.float32).ravel()
+    dim = query.shape[0]
+    entry = None
+    if use_cache:
+        with _rag_cache_lock:
+            entry = _rag_cache.get(user_id)
+            generation = _rag_generation(user_id)
+        if entry is not None and entry[2].shape[1] != dim:
+            entry = None
+    if entry is None:
+        entry = _load_rag_matrix(user_id, dim)
+        if use_cache:
+            with _rag_cache_lock:
+                # An insert during the load may not be in `entry`; use it once, don't cache it
+                if _rag_generation(user_id) == generation:
+                    _rag_cache[user_id] = entry
+    contents, timestamps, matrix = entry
+    if not contents or k <= 0:
+        return []
+    norm = np.linalg.norm(query)
+    scores = matrix @ (query / norm if norm else query)
+    k = min(k, len(contents))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(contents[i], float(scores[i]), timestamps[i]) for i in top]
+
+def migrate_pickled_embeddings():
+    """
+    Convert rows written by the old pickle-based add_rag_context to float32 blobs.
+    This unpickles data, so only run it on a database you created yourself.
+    """
+    global _rag_epoch
+    conn = sqlite3.connect(DB_NAME)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, embedding FROM rag_context WHERE dim IS NULL")
     rows = cursor.fetchall()
-    # Unpickle embeddings
-    results = [(content, pickle.loads(embedding_blob), timestamp) for content, embedding_blob, timestamp in rows]
+    for row_id, blob in rows:
+        embedding_blob, dim = encode_embedding(pickle.loads(blob))
+        cursor.execute("UPDATE rag_context SET embedding = ?, dim = ? WHERE id = ?", (embedding_blob, dim, row_id))
+    conn.commit()
     conn.close()
-    return results
+    with _rag_cache_lock:
+        _rag_epoch += 1
+        _rag_cache.clear()
+    return len(rows)
 
 
 # ------------------------------
@@ -150,3 +244,5 @@ if __name__ == "__main__":
     add_rag_context(user_id, "Eat more vegetables", sample_embedding)
     rag = get_rag_context(user_id)
     print("RAG Context:", rag)
+    add_rag_context(user_id, "Cut down on sugary drinks", [0.3, 0.1, 0.0])
+    print("Closest context:", search_rag_context(user_id, [0.1, 0.2, 0.25], k=1))
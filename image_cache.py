@@ -0,0 +1,179 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # perceptual matching is skipped without Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_DIR = os.path.join(os.getenv("DATA_DIR", "data"), "image_cache")
+
+
+# A dHash with fewer set (or unset) bits than this comes from a flat or
+# low-texture image; those all look alike, so they only match exactly
+MIN_HASH_BITS = 8
+# Cells of the colour grid may differ by this many 16-level steps per channel
+COLOUR_TOLERANCE = 1
+
+
+@dataclass
+class ImageKeys:
+    sha256: str
+    phash: Optional[int]
+    colour: Optional[str] = None
+
+
+def perceptual_hash(image_bytes: bytes) -> Tuple[Optional[int], Optional[str]]:
+    """
+    (64-bit difference hash, colour signature), or (None, None) when the image
+    can't be decoded or has too little texture to be told apart from others.
+
+    dHash survives re-encoding, resizing and small edits but only sees
+    brightness changes; the colour signature (a 4x4 grid of mean RGB, each
+    channel in 16 levels, as hex) keeps a red plate from matching a green one.
+    """
+    if Image is None:
+        return None, None
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.draft("RGB", (64, 64))  # lets JPEG decode at reduced size
+            rgb = img.convert("RGB")
+            pixels = list(rgb.convert("L").resize((9, 8)).getdata())
+            grid = list(rgb.resize((4, 4), Image.BOX).getdata())
+    except Exception as e:
+        logger.debug(f"Could not compute perceptual hash: {str(e)}")
+        return None, None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    if not MIN_HASH_BITS <= bin(value).count("1") <= 64 - MIN_HASH_BITS:
+        return None, None
+    colour = "".join(f"{channel >> 4:x}" for cell in grid for channel in cell)
+    return value, colour
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def colours_match(a: str, b: str) -> bool:
+    return len(a) == len(b) and all(abs(int(x, 16) - int(y, 16)) <= COLOUR_TOLERANCE for x, y in zip(a, b))
+
+
+class ImageAnalysisCache:
+    """
+    Disk-backed cache of food image analyses. Exact re-uploads are found by
+    SHA-256 of the bytes; re-encoded or resized copies of the same photo by a
+    perceptual hash within `max_distance` bits whose colour signature also
+    matches. One small JSON file per entry
+    keeps writes cheap; the least recently used entries beyond `max_entries`
+    are deleted.
+    """
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_entries: int = 1000, max_distance: int = 4):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        # sha256 -> (phash, colour); entries without both only match exactly
+        self._phashes: Dict[str, Tuple[Optional[int], Optional[str]]] = {}
+        self._stats = {"hits": 0, "perceptual_hits": 0, "misses": 0}
+        self._load()
+
+    def _path(self, sha: str) -> str:
+        return os.path.join(self.directory, f"{sha}.json")
+
+    def _load(self):
+        if not os.path.isdir(self.directory):
+            return
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                self._phashes[entry["sha256"]] = (entry.get("phash"), entry.get("colour"))
+            except Exception as e:
+                logger.warning(f"Skipping unreadable image cache entry {filename}: {str(e)}")
+
+    def keys_for(self, image_bytes: bytes) -> ImageKeys:
+        return ImageKeys(hashlib.sha256(image_bytes).hexdigest(), *perceptual_hash(image_bytes))
+
+    def _read(self, sha: str) -> Optional[str]:
+        path = self._path(sha)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                analysis = json.load(f)["analysis"]
+            os.utime(path)  # mtime doubles as the LRU clock
+            return analysis
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def get(self, keys: ImageKeys) -> Optional[str]:
+        with self._lock:
+            if keys.sha256 in self._phashes:
+                analysis = self._read(keys.sha256)
+                if analysis is not None:
+                    self._stats["hits"] += 1
+                    return analysis
+            if keys.phash is not None and keys.colour is not None:
+                best: Tuple[int, Optional[str]] = (self.max_distance + 1, None)
+                for sha, (phash, colour) in self._phashes.items():
+                    if phash is not None and colour is not None and colours_match(keys.colour, colour):
+                        distance = hamming(keys.phash, phash)
+                        if distance < best[0]:
+                            best = (distance, sha)
+                if best[1] is not None:
+                    analysis = self._read(best[1])
+                    if analysis is not None:
+                        self._stats["perceptual_hits"] += 1
+                        logger.info(f"Image cache perceptual hit (distance {best[0]})")
+                        return analysis
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, keys: ImageKeys, analysis: str):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(keys.sha256)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"sha256": keys.sha256, "phash": keys.phash, "colour": keys.colour, "analysis": analysis,
+                           "created_at": time.strftime("%Y-%m-%d %H:%M:%S")}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+            self._phashes[keys.sha256] = (keys.phash, keys.colour)
+            if len(self._phashes) > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        by_age = []
+        for sha in self._phashes:
+            try:
+                by_age.append((os.path.getmtime(self._path(sha)), sha))
+            except OSError:
+                by_age.append((0.0, sha))
+        by_age.sort()
+        for _, sha in by_age[:len(self._phashes) - self.max_entries]:
+            self._phashes.pop(sha, None)
+            try:
+                os.remove(self._path(sha))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._phashes)
+        lookups = stats["hits"] + stats["perceptual_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["hits"] + stats["perceptual_hits"]) / lookups if lookups else 0.0
+        return stats
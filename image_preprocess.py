@@ -0,0 +1,137 @@
+import io
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # images are sent as uploaded without Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Longest edge sent to the vision model; phone photos are often 4000px+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+
+# Formats the vision model accepts as-is
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "HEIC": "image/heic",
+    "HEIF": "image/heif",
+}
+
+_MAGIC = [
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF8", "GIF"),
+    (b"BM", "BMP"),
+]
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("IMAGE_WORKERS", "2")),
+                               thread_name_prefix="image-preprocess")
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    source_format: str
+    original_bytes: int
+    elapsed_ms: float
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.data)
+
+
+def sniff_format(image_bytes: bytes) -> str:
+    """Format from the file signature, for when Pillow can't decode the upload"""
+    for magic, fmt in _MAGIC:
+        if image_bytes.startswith(magic):
+            return fmt
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "WEBP"
+    if image_bytes[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1", b"ftypheif"):
+        return "HEIC"
+    return "JPEG"
+
+
+def _encode(img, fmt: str, quality: int) -> bytes:
+    if img.mode not in ("RGB", "L"):
+        # JPEG has no alpha; flatten transparent PNGs onto white
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        rgba = img.convert("RGBA")
+        background.paste(rgba, mask=rgba.split()[-1])
+        img = background
+    buffer = io.BytesIO()
+    options = {"quality": quality}
+    if fmt == "JPEG":
+        options.update(optimize=True, progressive=True)
+    else:
+        options["method"] = 4
+    img.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def preprocess_image(image_bytes: bytes, max_edge: int = IMAGE_MAX_EDGE,
+                     quality: int = IMAGE_QUALITY, target_format: str = IMAGE_FORMAT) -> PreparedImage:
+    """
+    Detect the real format, apply the EXIF orientation, shrink to `max_edge`
+    and re-encode. The original bytes are kept when they are already small,
+    upright and in a format the model accepts, and re-encoding wouldn't help.
+    """
+    start = time.perf_counter()
+    original_size = len(image_bytes)
+
+    def result(data, fmt, source):
+        prepared = PreparedImage(data, MIME_TYPES.get(fmt, "image/jpeg"), source, original_size,
+                                 (time.perf_counter() - start) * 1000)
+        logger.info(f"Image preprocessed: {source} {original_size} -> {len(data)} bytes "
+                    f"({prepared.bytes_saved} saved) in {prepared.elapsed_ms:.1f} ms")
+        return prepared
+
+    if Image is None:
+        fmt = sniff_format(image_bytes)
+        return result(image_bytes, fmt, fmt)
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            source = (img.format or sniff_format(image_bytes)).upper()
+            # Decode JPEGs at a reduced scale straight away when they are far too big
+            img.draft("RGB", (max_edge, max_edge))
+            rotated = img.getexif().get(0x0112, 1) != 1  # EXIF Orientation tag
+            oriented = ImageOps.exif_transpose(img) if rotated else img
+            too_big = max(img.size) > max_edge
+            if not too_big and not rotated and source in MIME_TYPES and source not in ("HEIC", "HEIF"):
+                candidate = _encode(oriented, target_format, quality)
+                if len(candidate) >= original_size:
+                    return result(image_bytes, source, source)
+                return result(candidate, target_format, source)
+            if too_big:
+                oriented = oriented.copy()
+                oriented.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            return result(_encode(oriented, target_format, quality), target_format, source)
+    except Exception as e:
+        logger.warning(f"Image preprocessing failed, sending original: {str(e)}")
+        fmt = sniff_format(image_bytes)
+        return result(image_bytes, fmt, fmt)
+
+
+def preprocess_image_async(image_bytes: bytes) -> "Future[PreparedImage]":
+    """Run `preprocess_image` on the shared worker pool"""
+    return _executor.submit(preprocess_image, image_bytes)
+
+
+if __name__ == "__main__":
+    import sys
+    for path in sys.argv[1:]:
+        with open(path, "rb") as f:
+            prepared = preprocess_image(f.read())
+        print(f"{path}: {prepared.source_format} -> {prepared.mime_type}, "
+              f"{prepared.original_bytes} -> {len(prepared.data)} bytes in {prepared.elapsed_ms:.1f} ms")
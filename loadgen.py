@@ -0,0 +1,380 @@
+"""
+Replayable load generator for flask_server.py.
+
+Builds a user population, registers it, gives every user a chat history, and
+then drives a weighted mix of text, image and voice chats and profile reads
+at a fixed concurrency. It reports throughput and a p50/p95/p99 latency
+histogram per endpoint. Run it against a server pointed at mock_services.py
+to measure our own overhead without spending Gemini quota:
+
+    python loadgen.py --users 50 --history 3 --requests 1000 --concurrency 16 --save scenario.jsonl
+    python loadgen.py --replay scenario.jsonl --output after.json
+
+The scenario (who sends what, in which order) is derived from --seed, and the
+uploaded images and audio are regenerated from it, so a saved scenario replays
+byte for byte. Replays register the same users under fresh ids unless
+--keep-ids is given.
+"""
+import argparse
+import io
+import json
+import random
+import struct
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:  # uploads become minimal JPEG-signed blobs without Pillow
+    Image = None
+
+# Share of the steady-state phase per request type
+DEFAULT_MIX = {"chat_text": 0.6, "chat_image": 0.1, "chat_voice": 0.1, "get_user": 0.2}
+ENDPOINTS = {
+    "register": "POST /api/register",
+    "chat_text": "POST /api/chat (text)",
+    "chat_image": "POST /api/chat (image)",
+    "chat_voice": "POST /api/chat (voice)",
+    "get_user": "GET /api/user/<id>",
+}
+# Histogram bucket upper bounds in ms
+BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float("inf")]
+
+QUESTIONS = [
+    "What should I eat before a morning run?",
+    "Give me a high protein breakfast idea",
+    "Is rice better than pasta for my goal?",
+    "How can I cut down on sugar cravings?",
+    "What are good snacks for late at night?",
+    "Suggest a vegetarian dinner with enough protein",
+    "How much water should I drink on training days?",
+    "how many calories in cream cheese",
+    "Plan my meals for today to hit my macros",
+    "Can I eat bread while trying to lose weight?",
+    "What's a good post-workout meal?",
+    "Is intermittent fasting a good idea for me?",
+]
+FIRST_NAMES = ["Aisha", "Omar", "Sara", "Yusuf", "Mariam", "Khalid", "Noor", "Hamad", "Lina", "Salim",
+               "Fatma", "Ali", "Huda", "Majid", "Reem", "Tariq"]
+
+
+# --- scenario ---------------------------------------------------------------
+
+def build_population(count: int, rng: random.Random, prefix: str) -> List[dict]:
+    """Registration payloads with a realistic spread of ages, sizes, goals and activity levels"""
+    users = []
+    for i in range(count):
+        gender = rng.choice(["male", "female"])
+        height = round(rng.gauss(176 if gender == "male" else 163, 7), 1)
+        bmi = min(max(rng.gauss(26, 4), 18), 40)
+        goal = rng.choices(["loss", "maintenance", "gain"], weights=[5, 3, 2])[0]
+        user = {
+            "userId": f"{prefix}_{i}",
+            "name": f"{rng.choice(FIRST_NAMES)} {i}",
+            "age": rng.randint(18, 70),
+            "weight": round(min(max(bmi * (height / 100) ** 2, 35), 250), 1),
+            "height": min(max(height, 140), 210),
+            "gender": gender,
+            "activityLevel": rng.choices(["sedentary", "light", "moderate", "very_active", "extra_active"],
+                                         weights=[3, 4, 4, 2, 1])[0],
+            "goal": goal,
+        }
+        if goal == "gain":
+            user["surplus"] = rng.choice([300, 400, 500])
+        users.append(user)
+    return users
+
+
+def build_scenario(users: int = 20, history: int = 3, requests: int = 200, mix: Dict[str, float] = None,
+                   seed: int = 0, prefix: Optional[str] = None) -> List[dict]:
+    """
+    Every step of a run, in order: one "register" phase step per user, then
+    `history` text chats per user, then `requests` steps drawn from `mix`.
+    """
+    rng = random.Random(seed)
+    prefix = prefix or f"load_{uuid.uuid4().hex[:6]}"
+    population = build_population(users, rng, prefix)
+    steps = [{"phase": "register", "kind": "register", "payload": user} for user in population]
+    for _ in range(history):
+        for user in population:
+            steps.append({"phase": "history", "kind": "chat_text", "user_id": user["userId"],
+                          "message": rng.choice(QUESTIONS)})
+    mix = mix or DEFAULT_MIX
+    kinds, weights = list(mix), list(mix.values())
+    for _ in range(requests):
+        kind = rng.choices(kinds, weights=weights)[0]
+        step = {"phase": "steady", "kind": kind, "user_id": rng.choice(population)["userId"]}
+        if kind == "chat_text":
+            step["message"] = rng.choice(QUESTIONS)
+        elif kind == "chat_image":
+            # A small pool, so some uploads repeat like re-sent photos do
+            step["image"] = rng.randrange(16)
+            step["message"] = rng.choice(["", "How many calories is this?", "Is this good for my goal?"])
+        elif kind == "chat_voice":
+            step["audio"] = rng.randrange(16)
+        steps.append(step)
+    return steps
+
+
+def with_fresh_ids(steps: List[dict], prefix: Optional[str] = None) -> List[dict]:
+    """The same scenario under new user ids, so it can be replayed against a server that has the old ones"""
+    prefix = prefix or f"load_{uuid.uuid4().hex[:6]}"
+    mapping: Dict[str, str] = {}
+    renamed = []
+    for step in steps:
+        step = json.loads(json.dumps(step))
+        if step["kind"] == "register":
+            old = step["payload"]["userId"]
+            step["payload"]["userId"] = mapping.setdefault(old, f"{prefix}_{len(mapping)}")
+        else:
+            step["user_id"] = mapping.setdefault(step["user_id"], f"{prefix}_{len(mapping)}")
+        renamed.append(step)
+    return renamed
+
+
+def save_scenario(steps: List[dict], path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        for step in steps:
+            f.write(json.dumps(step, ensure_ascii=False) + "\n")
+
+
+def load_scenario(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# --- uploads ----------------------------------------------------------------
+
+_uploads: Dict[tuple, bytes] = {}
+_uploads_lock = threading.Lock()
+
+
+def food_photo(index: int, size=(1600, 1200)) -> bytes:
+    """A deterministic phone-photo-sized JPEG (noise over a colour gradient)"""
+    rng = np.random.default_rng(index)
+    if Image is None:
+        return b"\xff\xd8\xff\xe0" + rng.bytes(200_000)
+    height, width = size[1], size[0]
+    base = np.linspace(40 + index * 10, 220, width, dtype=np.float32)[None, :, None]
+    pixels = np.clip(base + rng.normal(0, 25, (height, width, 3)), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, "RGB").save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def voice_clip(index: int, seconds: float = 2.0, rate: int = 16000) -> bytes:
+    """A deterministic 16-bit mono WAV clip"""
+    rng = np.random.default_rng(1000 + index)
+    t = np.arange(int(seconds * rate)) / rate
+    samples = (0.3 * np.sin(2 * np.pi * (180 + 20 * index) * t) + rng.normal(0, 0.02, t.size)) * 32767
+    pcm = np.clip(samples, -32768, 32767).astype("<i2").tobytes()
+    header = (b"RIFF" + struct.pack("<I", 36 + len(pcm)) + b"WAVEfmt "
+              + struct.pack("<IHHIIHH", 16, 1, 1, rate, rate * 2, 2, 16) + b"data" + struct.pack("<I", len(pcm)))
+    return header + pcm
+
+
+def _upload(kind: str, index: int) -> bytes:
+    key = (kind, index)
+    with _uploads_lock:
+        if key not in _uploads:
+            _uploads[key] = food_photo(index) if kind == "image" else voice_clip(index)
+        return _uploads[key]
+
+
+def _multipart(fields: Dict[str, str], files: Dict[str, tuple]) -> tuple:
+    boundary = f"----loadgen{uuid.uuid4().hex}"
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n"
+                   .encode("utf-8"))
+    for name, (filename, content_type, data) in files.items():
+        body.write(f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+                   f"Content-Type: {content_type}\r\n\r\n".encode("utf-8"))
+        body.write(data)
+        body.write(b"\r\n")
+    body.write(f"--{boundary}--\r\n".encode("utf-8"))
+    return body.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+# --- execution --------------------------------------------------------------
+
+def _request(base_url: str, step: dict, timeout: float) -> tuple:
+    """Sends one step; returns (HTTP status or 0 on a connection error, app-level error or None)"""
+    kind = step["kind"]
+    headers = {}
+    if kind == "register":
+        url, method = f"{base_url}/api/register", "POST"
+        data = json.dumps(step["payload"]).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    elif kind == "get_user":
+        url, method, data = f"{base_url}/api/user/{step['user_id']}", "GET", None
+    else:
+        fields = {"user_id": step["user_id"]}
+        if step.get("message"):
+            fields["message"] = step["message"]
+        files = {}
+        if kind == "chat_image":
+            files["image"] = (f"meal_{step['image']}.jpg", "image/jpeg", _upload("image", step["image"]))
+        elif kind == "chat_voice":
+            files["audio"] = (f"voice_{step['audio']}.wav", "audio/wav", _upload("audio", step["audio"]))
+        data, headers["Content-Type"] = _multipart(fields, files)
+        url, method = f"{base_url}/api/chat", "POST"
+
+    req = urllib.request.Request(url, data=data, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            body = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except Exception as e:
+        return 0, type(e).__name__
+    if kind.startswith("chat_"):
+        try:
+            answer = json.loads(body).get("response", "")
+        except ValueError:
+            return status, "invalid JSON"
+        # The chat endpoint reports model/speech failures as a 200 with an error text
+        if answer.startswith("Error") or answer.startswith("❌"):
+            return status, "error answer"
+    return status, None
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[tuple]] = {}
+
+    def add(self, kind: str, ms: float, status: int, error: Optional[str]):
+        with self._lock:
+            self.samples.setdefault(kind, []).append((ms, status, error))
+
+
+def run_phase(base_url: str, steps: List[dict], concurrency: int, timeout: float) -> Dict[str, Any]:
+    recorder = Recorder()
+
+    def send(step):
+        started = time.perf_counter()
+        status, error = _request(base_url, step, timeout)
+        recorder.add(step["kind"], (time.perf_counter() - started) * 1000, status, error)
+
+    # Build the uploads up front so they aren't timed
+    for step in steps:
+        if "image" in step:
+            _upload("image", step["image"])
+        if "audio" in step:
+            _upload("audio", step["audio"])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, steps))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(steps),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(steps) / elapsed, 2) if elapsed else 0.0,
+        "endpoints": {ENDPOINTS[kind]: summarize(samples, elapsed) for kind, samples in recorder.samples.items()},
+    }
+
+
+def summarize(samples: List[tuple], elapsed: float) -> Dict[str, Any]:
+    latencies = np.array([ms for ms, _, _ in samples], dtype=np.float64)
+    statuses: Dict[str, int] = {}
+    errors = 0
+    for _, status, error in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if error is not None or not 200 <= status < 300:
+            errors += 1
+    counts = np.histogram(latencies, bins=[0] + BUCKETS_MS)[0]
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        "max_ms": round(float(latencies.max()), 1),
+        "mean_ms": round(float(latencies.mean()), 1),
+        "statuses": statuses,
+        "histogram": {("+inf" if bound == float("inf") else f"<={bound:g}ms"): int(count)
+                      for bound, count in zip(BUCKETS_MS, counts)},
+    }
+
+
+def run(base_url: str, steps: List[dict], concurrency: int = 8, timeout: float = 120) -> Dict[str, Any]:
+    report = {"base_url": base_url, "concurrency": concurrency, "phases": {}}
+    for phase in ("register", "history", "steady"):
+        phase_steps = [step for step in steps if step["phase"] == phase]
+        if phase_steps:
+            print(f"▶️ {phase}: {len(phase_steps)} requests")
+            report["phases"][phase] = run_phase(base_url, phase_steps, concurrency, timeout)
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    for phase, result in report["phases"].items():
+        print(f"\n=== {phase}: {result['requests']} requests in {result['elapsed_s']}s "
+              f"({result['throughput_rps']} req/s, concurrency {report['concurrency']}) ===")
+        for endpoint, row in sorted(result["endpoints"].items()):
+            print(f"{endpoint:<26} n={row['count']:<5} err={row['error_rate']:.1%}  "
+                  f"p50={row['p50_ms']:.0f}ms  p95={row['p95_ms']:.0f}ms  p99={row['p99_ms']:.0f}ms  "
+                  f"max={row['max_ms']:.0f}ms")
+            peak = max(row["histogram"].values()) or 1
+            for bucket, count in row["histogram"].items():
+                if count:
+                    print(f"    {bucket:>10} {'█' * max(1, round(30 * count / peak)):<30} {count}")
+
+
+def _parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        if kind.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown request type {kind!r}; use {', '.join(DEFAULT_MIX)}")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the Dietitian Flask API")
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--users", type=int, default=20, help="users to register")
+    parser.add_argument("--history", type=int, default=3, help="text chats per user before the measured mix")
+    parser.add_argument("--requests", type=int, default=200, help="requests in the steady-state mix")
+    parser.add_argument("--mix", type=_parse_mix, help="e.g. chat_text=6,chat_image=1,chat_voice=1,get_user=2")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--save", metavar="PATH", help="write the generated scenario as JSONL")
+    parser.add_argument("--replay", metavar="PATH", help="run a saved scenario instead of generating one")
+    parser.add_argument("--keep-ids", action="store_true",
+                        help="replay with the saved user ids (only against a fresh data dir)")
+    parser.add_argument("--output", metavar="PATH", help="write the report as JSON")
+    args = parser.parse_args()
+
+    if args.replay:
+        steps = load_scenario(args.replay)
+        if not args.keep_ids:
+            steps = with_fresh_ids(steps)
+        print(f"Replaying {len(steps)} requests from {args.replay}")
+    else:
+        steps = build_scenario(args.users, args.history, args.requests, args.mix, args.seed)
+    if args.save:
+        save_scenario(steps, args.save)
+        print(f"Scenario saved to {args.save}")
+
+    report = run(args.base_url.rstrip("/"), steps, args.concurrency, args.timeout)
+    report["scenario"] = {"seed": args.seed, "replay": args.replay, "steps": len(steps)}
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nReport written to {args.output}")
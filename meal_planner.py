@@ -0,0 +1,361 @@
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from food_facts import FoodTable, normalize_name
+
+logger = logging.getLogger(__name__)
+
+_linprog = False
+
+
+def get_linprog():
+    """scipy's LP solver, imported on first plan (it adds ~0.4s to startup); None without scipy"""
+    global _linprog
+    if _linprog is False:
+        try:
+            from scipy.optimize import linprog
+        except ImportError:  # the NumPy greedy search is used instead
+            linprog = None
+        _linprog = linprog
+    return _linprog
+
+# Food table columns, in the order of the target vector
+PLAN_COLUMNS = ["Calories", "Protein", "Carbohydrates", "Fat"]
+TARGET_KEYS = ["calories", "protein_g", "carbs_g", "fat_g"]
+# Calories matter most; the three macros equally
+TARGET_WEIGHTS = np.array([2.0, 1.0, 1.0, 1.0])
+
+SERVING_STEP = 0.5
+
+# "no dairy" / "no fish" style exclusions also cover these names
+EXCLUSION_GROUPS = {
+    "dairy": ["cheese", "milk", "yogurt", "cream", "butter", "custard", "ice cream"],
+    "fish": ["salmon", "tuna", "cod", "trout", "sardine", "anchov", "halibut", "herring", "mackerel",
+             "tilapia", "pollock", "haddock", "shad", "perch", "pike", "bass", "snapper", "flounder", "sole"],
+    "seafood": ["fish", "shrimp", "crab", "lobster", "clam", "oyster", "mussel", "scallop", "squid", "octopus"],
+    "meat": ["meat", "beef", "pork", "chicken", "turkey", "lamb", "veal", "ham", "bacon", "sausage", "steak",
+             "duck", "burger", "hot dog", "frank", "pepperoni", "salami", "bologna", "prosciutto", "pastrami",
+             "corned beef", "cold cut"],
+    "red meat": ["beef", "pork", "lamb", "veal", "ham", "bacon", "steak", "burger", "sausage", "hot dog", "frank",
+                 "pepperoni", "salami", "bologna", "prosciutto", "pastrami", "cold cut"],
+    "gluten": ["bread", "bagel", "biscuit", "pasta", "noodle", "muffin", "croissant", "pizza", "sandwich",
+               "cracker", "cereal", "wheat", "roll", "bun", "pancake", "waffle", "hotcake", "toast"],
+}
+
+_PLAN_INTENT = re.compile(
+    r"\b(meal plan|plan (?:my|a|the) (?:meals|day|diet)|(?:build|make|create|give|design|suggest)(?: me)? "
+    r"(?:a |my )?(?:full )?(?:day|daily|day's|days) (?:of )?(?:meals|eating|food|menu)|"
+    r"(?:meals|menu|diet) for my (?:macros|calories|goal))\b"
+)
+# One food in a list: up to three words, stopping at conjunctions and words that start a new request
+_LIST_WORD = (r"(?!(?:and|or|nor|no|not|neither|with|without|but|for|in|at|on|to|from|make|give|keep|please|it|i|under|over|"
+              r"high|low|more|less)\b)[a-z]+")
+_ITEM = rf"{_LIST_WORD}(?: {_LIST_WORD}){{0,2}}"
+_LIST_SEP = r"\s*(?:,\s*(?:(?:and|or|nor)\s+)?|\s+(?:and|or|nor)\s+)"
+# "no pork, beef or fish" / "without dairy and gluten": the whole list after the keyword
+_EXCLUDE = re.compile(r"\b(?:no|neither|without|excluding|exclude|except|avoid|hold the|dont eat|do not eat|allergic to)\s+"
+                      rf"({_ITEM}(?:{_LIST_SEP}{_ITEM})*)")
+_PREFER = re.compile(r"\b(?:with|include|including|prefer|i like|i love|using)\s+"
+                     rf"({_ITEM}(?:{_LIST_SEP}{_ITEM})*)")
+_LIST_SPLIT = re.compile(_LIST_SEP)
+
+
+def _list_items(pattern: re.Pattern, text: str) -> List[str]:
+    return [item.strip() for match in pattern.findall(text) for item in _LIST_SPLIT.split(match) if item.strip()]
+
+
+@dataclass
+class MealPlan:
+    items: List[Dict[str, float]]
+    totals: Dict[str, float]
+    targets: Dict[str, float]
+    within_tolerance: bool
+    tolerance: float
+    solver: str
+    elapsed_ms: float
+    excluded: List[str] = field(default_factory=list)
+    preferred: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "items": self.items,
+            "totals": self.totals,
+            "targets": self.targets,
+            "within_tolerance": self.within_tolerance,
+            "tolerance": self.tolerance,
+            "solver": self.solver,
+            "elapsed_ms": round(self.elapsed_ms, 2),
+            "excluded": self.excluded,
+            "preferred": self.preferred,
+        }
+
+    def to_text(self) -> str:
+        lines = ["Daily meal plan (servings from our food database):"]
+        for item in self.items:
+            servings = f"{item['servings']:g} serving{'s' if item['servings'] != 1 else ''}"
+            lines.append(f"- {item['food'].title()}: {servings} = {item['calories']:.0f} kcal, "
+                         f"{item['protein_g']:.0f}g protein, {item['carbs_g']:.0f}g carbs, {item['fat_g']:.0f}g fat")
+        t, g = self.totals, self.targets
+        lines.append(f"Total: {t['calories']:.0f}/{g['calories']:.0f} kcal, {t['protein_g']:.0f}/{g['protein_g']:.0f}g protein, "
+                     f"{t['carbs_g']:.0f}/{g['carbs_g']:.0f}g carbs, {t['fat_g']:.0f}/{g['fat_g']:.0f}g fat")
+        return "\n".join(lines)
+
+
+def targets_from_nutrition(nutrition: Optional[dict]) -> Optional[Dict[str, float]]:
+    """Plan targets from a stored db.compute_nutrition result."""
+    if not nutrition or not nutrition.get("Goal Calories"):
+        return None
+    macros = nutrition.get("Macros") or {}
+    return {
+        "calories": float(nutrition["Goal Calories"]),
+        "protein_g": float(macros.get("protein_g", 0)),
+        "carbs_g": float(macros.get("carbs_g", 0)),
+        "fat_g": float(macros.get("fat_g", 0)),
+    }
+
+
+def detect_meal_plan_request(question: str) -> Optional[Dict[str, List[str]]]:
+    """
+    Recognizes "build me a day of meals for my macros" style questions and
+    pulls out foods to avoid ("no pork", "without dairy") and to include.
+    """
+    text = normalize_name(question or "").replace(" t ", "t ")
+    if not text or not _PLAN_INTENT.search(text):
+        return None
+    # normalize_name drops commas, which separate the foods in a list
+    listed = re.sub(r"\s+", " ", re.sub(r"[^a-z0-9\s,]", " ", (question or "").lower().replace("'", "")))
+    exclude = _list_items(_EXCLUDE, listed)
+    prefer = [item for item in _list_items(_PREFER, listed) if not item.startswith(("my ", "a ", "the "))]
+    return {"exclude": exclude, "prefer": prefer}
+
+
+class MealPlanner:
+    """
+    Picks servings of foods from the food table so the day's totals hit the
+    calorie and macro targets. A linear program over servings (HiGHS via
+    SciPy, or a NumPy greedy search without it) finds a sparse mix, which is
+    rounded to half servings and polished with a small local search.
+    """
+
+    def __init__(self, table: FoodTable):
+        self.table = table
+        self.names = [normalize_name(name) for name in table.names]
+        self.matrix = np.column_stack([np.asarray(table.columns[c], dtype=np.float64) for c in PLAN_COLUMNS])
+        # Rows with no energy can't contribute and only confuse the solver
+        self._usable = self.matrix[:, 0] > 0
+
+    def _matching_rows(self, terms: Iterable[str]) -> np.ndarray:
+        """Foods named with a whole-word match of any term ("egg" matches "poached egg")."""
+        mask = np.zeros(len(self.names), dtype=bool)
+        for term in terms:
+            term = normalize_name(term)
+            if not term:
+                continue
+            pattern = re.compile(rf"\b{re.escape(term.rstrip('s'))}s?\b")
+            mask |= np.fromiter((bool(pattern.search(name)) for name in self.names), bool, len(self.names))
+        return mask
+
+    def _excluded_rows(self, terms: Iterable[str]) -> np.ndarray:
+        """
+        Exclusions match inside words and expand food groups, erring on the
+        side of leaving a food out ("fish" also drops "catfish" and "salmon").
+        """
+        needles = set()
+        for term in terms:
+            term = normalize_name(term)
+            if term:
+                needles.add(term.rstrip("s") if len(term) > 3 else term)
+                needles.update(EXCLUSION_GROUPS.get(term, ()))
+        return np.fromiter((any(needle in name for needle in needles) for name in self.names),
+                           bool, len(self.names))
+
+    @staticmethod
+    def _error(totals: np.ndarray, target: np.ndarray) -> np.ndarray:
+        """Weighted relative distance to the targets; works on one or many candidate totals."""
+        return (np.abs(totals - target) / target * TARGET_WEIGHTS).sum(axis=-1)
+
+    def _solve_lp(self, A: np.ndarray, target: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+                  cost: np.ndarray) -> Optional[np.ndarray]:
+        n = len(A)
+        # Variables: servings x (n), over-shoot (4), under-shoot (4)
+        weights = TARGET_WEIGHTS / target
+        c = np.concatenate([cost, weights, weights])
+        A_eq = np.hstack([A.T, -np.eye(4), np.eye(4)])
+        bounds = [(lo, hi) for lo, hi in zip(lower, upper)] + [(0, None)] * 8
+        result = get_linprog()(c, A_eq=A_eq, b_eq=target, bounds=bounds, method="highs")
+        if not result.success:
+            logger.warning(f"Meal plan LP failed: {result.message}")
+            return None
+        return result.x[:n]
+
+    def _solve_greedy(self, A: np.ndarray, target: np.ndarray, lower: np.ndarray,
+                      upper: np.ndarray, max_items: int) -> np.ndarray:
+        x = lower.copy()
+        totals = x @ A
+        for _ in range(int(upper.sum() / SERVING_STEP)):
+            candidates = totals + SERVING_STEP * A
+            errors = self._error(candidates, target)
+            errors[x + SERVING_STEP > upper] = np.inf
+            if (x > 0).sum() >= max_items:
+                errors[x == 0] = np.inf
+            best = int(np.argmin(errors))
+            if errors[best] >= self._error(totals, target):
+                break
+            x[best] += SERVING_STEP
+            totals = candidates[best]
+        return x
+
+    def _limit_items(self, x: np.ndarray, A: np.ndarray, target: np.ndarray, lower: np.ndarray,
+                     upper: np.ndarray, cost: np.ndarray, max_items: int) -> Optional[np.ndarray]:
+        """
+        The LP has no item count, so when its mix is too wide keep the forced
+        foods plus the largest calorie contributors and re-solve on just those.
+        """
+        share = x * A[:, 0]
+        share[lower > 0] = np.inf
+        keep = np.argsort(-share)[:max_items]
+        sub = self._solve_lp(A[keep], target, lower[keep], upper[keep], cost[keep])
+        if sub is None:
+            return None
+        limited = np.zeros(len(x))
+        limited[keep] = sub
+        return limited
+
+    def _polish(self, x: np.ndarray, A: np.ndarray, target: np.ndarray, lower: np.ndarray,
+                upper: np.ndarray, max_items: int) -> np.ndarray:
+        """
+        Local search in half servings: add or remove one step of any food, or
+        move a step from a chosen food to any other, while that gets closer to
+        the targets. Every round scores all moves at once.
+        """
+        n = len(x)
+        totals = x @ A
+        current = self._error(totals, target)
+        for _ in range(100):
+            chosen = np.flatnonzero(x > 0)
+            room = len(chosen) < max_items
+            # Single steps: one more step of any food, one less of a chosen one
+            plus_ok = (x + SERVING_STEP <= upper + 1e-9) & ((x > 0) | room)
+            minus_ok = x - SERVING_STEP >= lower - 1e-9
+            plus = np.where(plus_ok, self._error(totals + SERVING_STEP * A, target), np.inf)
+            minus = np.where(minus_ok, self._error(totals - SERVING_STEP * A, target), np.inf)
+            # Swaps: a step off chosen food i onto food j
+            givers = chosen[minus_ok[chosen]]
+            swap = np.full((len(givers), n), np.inf)
+            if len(givers):
+                trial = totals[None, None, :] + SERVING_STEP * (A[None, :, :] - A[givers][:, None, :])
+                swap = self._error(trial, target)
+                frees_slot = x[givers] - SERVING_STEP <= 1e-9
+                receiver_ok = (x + SERVING_STEP <= upper + 1e-9)[None, :] & (
+                    (x > 0)[None, :] | room | frees_slot[:, None])
+                swap[~receiver_ok] = np.inf
+                swap[np.arange(len(givers)), givers] = np.inf
+            options = [plus.min(), minus.min(), swap.min() if swap.size else np.inf]
+            best = int(np.argmin(options))
+            if options[best] >= current - 1e-9:
+                break
+            if best == 0:
+                x[int(np.argmin(plus))] += SERVING_STEP
+            elif best == 1:
+                x[int(np.argmin(minus))] -= SERVING_STEP
+            else:
+                g, j = np.unravel_index(int(np.argmin(swap)), swap.shape)
+                x[givers[g]] -= SERVING_STEP
+                x[j] += SERVING_STEP
+            totals = x @ A
+            current = self._error(totals, target)
+        return x
+
+    def plan(self, targets: Dict[str, float], exclude: Iterable[str] = (), prefer: Iterable[str] = (),
+             max_servings: float = 3.0, max_share: float = 0.4, max_items: int = 8,
+             tolerance: float = 0.05) -> MealPlan:
+        """
+        `targets` has calories, protein_g, carbs_g and fat_g. Foods whose names
+        contain an `exclude` term are never used; each food matching a `prefer`
+        term gets at least one serving. No single food may supply more than
+        `max_share` of the calories, and the plan uses at most `max_items` foods.
+        """
+        started = time.perf_counter()
+        exclude, prefer = list(exclude), list(prefer)
+        target = np.array([float(targets[key]) for key in TARGET_KEYS])
+        target = np.maximum(target, 1.0)
+
+        allowed = self._usable & ~self._excluded_rows(exclude)
+        preferred = self._matching_rows(prefer) & allowed
+        rows = np.flatnonzero(allowed)
+        A = self.matrix[rows]
+        upper = np.minimum(max_servings, np.floor(max_share * target[0] / A[:, 0] / SERVING_STEP) * SERVING_STEP)
+        is_preferred = preferred[rows]
+        # Only the single best match of each preferred term is forced in, and
+        # never more of them than max_items allows (earlier terms win)
+        lower = np.zeros(len(rows))
+        forced = []
+        for term in prefer:
+            hits = np.flatnonzero(self._matching_rows([term])[rows] & (upper >= 1))
+            if len(hits) and hits[0] not in forced and len(forced) < max_items:
+                forced.append(hits[0])
+                lower[hits[0]] = 1.0
+        upper = np.maximum(upper, lower)
+
+        if get_linprog() is not None:
+            # A tiny per-serving cost keeps the mix small; preferred foods are cheaper
+            cost = np.where(is_preferred, 1e-4, 1e-3)
+            x = self._solve_lp(A, target, lower, upper, cost)
+            solver = "linprog"
+            if x is not None and (x > 1e-6).sum() > max_items:
+                x = self._limit_items(x, A, target, lower, upper, cost, max_items)
+        else:
+            x = None
+        if x is None:
+            x = self._solve_greedy(A, target, lower, upper, max_items)
+            solver = "greedy"
+
+        x = np.clip(np.round(x / SERVING_STEP) * SERVING_STEP, lower, upper)
+        x = self._polish(x, A, target, lower, upper, max_items)
+
+        chosen = np.flatnonzero(x > 0)
+        chosen = chosen[np.argsort(-(x[chosen, None] * A[chosen])[:, 0])]
+        items = []
+        for i in chosen:
+            amounts = x[i] * A[i]
+            items.append({
+                "food": self.table.names[rows[i]],
+                "servings": float(x[i]),
+                "calories": round(float(amounts[0]), 1),
+                "protein_g": round(float(amounts[1]), 1),
+                "carbs_g": round(float(amounts[2]), 1),
+                "fat_g": round(float(amounts[3]), 1),
+            })
+        totals = x @ A
+        within = bool(np.all(np.abs(totals - target) <= tolerance * target))
+        plan = MealPlan(
+            items=items,
+            totals={key: round(float(v), 1) for key, v in zip(TARGET_KEYS, totals)},
+            targets={key: float(targets[key]) for key in TARGET_KEYS},
+            within_tolerance=within,
+            tolerance=tolerance,
+            solver=solver,
+            elapsed_ms=(time.perf_counter() - started) * 1000,
+            excluded=exclude,
+            preferred=prefer,
+        )
+        logger.info(f"Meal plan: {len(items)} foods via {solver} in {plan.elapsed_ms:.1f} ms "
+                    f"({'within' if within else 'outside'} {tolerance:.0%} of targets)")
+        return plan
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+    planner = MealPlanner(FoodTable.from_csv())
+    calories = float(sys.argv[1]) if len(sys.argv) > 1 else 2200
+    macros = {"protein_g": round(calories * 0.3 / 4), "carbs_g": round(calories * 0.4 / 4),
+              "fat_g": round(calories * 0.3 / 9)}
+    result = planner.plan({"calories": calories, **macros}, exclude=sys.argv[2:])
+    print(result.to_text())
+    print(json.dumps({k: v for k, v in result.to_dict().items() if k != "items"}, indent=2))
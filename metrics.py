@@ -0,0 +1,298 @@
+"""
+In-process metrics with Prometheus text output (no client library needed).
+
+`span(name)` times a block into a histogram and, when the current request
+asked for it, into that request's Trace so the breakdown can be returned with
+the response. Stage threads started through StageRunner inherit the trace.
+"""
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Seconds; spans range from sub-millisecond cache reads to minute-long Gemini calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Tuple[str, ...]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(str(label) for label in labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, seconds: float, *labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        lines = self.header()
+        for key, (counts, total, count) in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect: Callable[[], List[str]]):
+        """`collect` returns ready-made exposition lines, computed at scrape time"""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                lines.extend(collect())
+            except Exception as e:  # one broken source shouldn't take down the scrape
+                lines.append(f"# collector failed: {_escape(str(e))}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "dietitian_stage_seconds", "Time spent in each chat pipeline stage", ("stage",)))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "dietitian_stage_errors_total", "Stages and db operations that raised", ("stage",)))
+STAGE_TIMEOUTS = REGISTRY.register(Counter(
+    "dietitian_stage_timeouts_total", "Chat stages abandoned after their timeout", ("stage",)))
+DB_SECONDS = REGISTRY.register(Histogram(
+    "dietitian_db_seconds", "Time spent in db.py storage operations", ("operation",)))
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "dietitian_http_requests_total", "HTTP requests by endpoint and status", ("method", "endpoint", "status")))
+HTTP_ERRORS = REGISTRY.register(Counter(
+    "dietitian_http_errors_total", "HTTP requests that ended with a 5xx status", ("endpoint",)))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "dietitian_http_request_seconds", "Time until the response is handed to the server (streams: headers)",
+    ("endpoint",)))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "dietitian_http_requests_in_flight", "Requests currently being handled"))
+HTTP_IN_FLIGHT.set(0)
+
+_caches: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+
+
+def register_cache(name: str, stats: Callable[[], Dict[str, Any]]):
+    """Exposes a cache's stats() (hits / misses / size / hit_ratio) under cache="name"."""
+    _caches.append((name, stats))
+
+
+def _collect_caches() -> List[str]:
+    rows = []
+    for name, stats in _caches:
+        try:
+            values = stats()
+        except Exception:
+            continue
+        # Near-duplicate image hits count as hits too
+        hits = values.get("hits", 0) + values.get("perceptual_hits", 0)
+        rows.append((name, hits, values.get("misses", 0), values.get("size"), values.get("hit_ratio", 0.0)))
+    if not rows:
+        return []
+    lines = ["# HELP dietitian_cache_hits_total Cache lookups served from the cache",
+             "# TYPE dietitian_cache_hits_total counter"]
+    lines += [f'dietitian_cache_hits_total{{cache="{name}"}} {hits}' for name, hits, _, _, _ in rows]
+    lines += ["# HELP dietitian_cache_misses_total Cache lookups that missed",
+              "# TYPE dietitian_cache_misses_total counter"]
+    lines += [f'dietitian_cache_misses_total{{cache="{name}"}} {misses}' for name, _, misses, _, _ in rows]
+    lines += ["# HELP dietitian_cache_hit_ratio Hits over lookups since start", "# TYPE dietitian_cache_hit_ratio gauge"]
+    lines += [f'dietitian_cache_hit_ratio{{cache="{name}"}} {_number(float(ratio))}' for name, _, _, _, ratio in rows]
+    sized = [(name, size) for name, _, _, size, _ in rows if size is not None]
+    if sized:
+        lines += ["# HELP dietitian_cache_entries Entries currently cached", "# TYPE dietitian_cache_entries gauge"]
+        lines += [f'dietitian_cache_entries{{cache="{name}"}} {size}' for name, size in sized]
+    return lines
+
+
+REGISTRY.add_collector(_collect_caches)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# --- per-request traces -------------------------------------------------------
+
+class Trace:
+    """Span durations for one request, for the optional timing breakdown in the response"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._spans: List[Tuple[str, float]] = []
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self._spans.append((name, seconds))
+
+    def summary(self) -> Dict[str, Any]:
+        """{"total_ms": ..., "spans": {name: {"count", "ms"}}} with spans in the order they finished"""
+        spans: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            recorded = list(self._spans)
+        for name, seconds in recorded:
+            entry = spans.setdefault(name, {"count": 0, "ms": 0.0})
+            entry["count"] += 1
+            entry["ms"] += seconds * 1000
+        for entry in spans.values():
+            entry["ms"] = round(entry["ms"], 2)
+        return {"total_ms": round((time.perf_counter() - self.started) * 1000, 2), "spans": spans}
+
+
+_trace: contextvars.ContextVar = contextvars.ContextVar("dietitian_trace", default=None)
+
+
+def start_trace() -> Tuple[Trace, contextvars.Token]:
+    trace = Trace()
+    return trace, _trace.set(trace)
+
+
+def end_trace(token: contextvars.Token):
+    _trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+@contextmanager
+def tracing(trace: Optional[Trace]):
+    """Makes `trace` current for the block, e.g. inside a streamed response generator"""
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def span(name: str, histogram: Histogram = STAGE_SECONDS):
+    """Times the block into `histogram` (labelled `name`) and the current request's trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, name)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(name, elapsed)
+
+
+def timed(name: str, histogram: Histogram = STAGE_SECONDS):
+    """Decorator form of span()"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, histogram):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,245 @@
+"""
+Local stand-in for the Gemini REST API and the Google speech endpoint, for
+load tests that shouldn't spend real quota.
+
+    python mock_services.py --profile typical --port 8089
+    export GEMINI_API_ENDPOINT=http://localhost:8089
+    export SPEECH_API_URL=http://localhost:8089/speech-api/v2/recognize
+    python flask_server.py
+
+Implements generateContent, streamGenerateContent (JSON array and ?alt=sse),
+countTokens and model lookup for any model name, plus the speech v2
+recognize call. Latency, chunking and error rate come from a profile and can
+be changed at runtime with POST /mock/config; GET /mock/stats returns counters.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from typing import Any, Dict
+
+from flask import Flask, Response, jsonify, request
+
+# Latencies in ms. Text latency is time to first chunk plus per-chunk time;
+# jitter scales every delay by a uniform factor in [1 - jitter, 1 + jitter].
+PROFILES = {
+    "instant": {"first_token_ms": 0, "chunk_ms": 0, "chunks": 8, "image_ms": 0, "speech_ms": 0,
+                "jitter": 0.0, "error_rate": 0.0},
+    "typical": {"first_token_ms": 600, "chunk_ms": 40, "chunks": 12, "image_ms": 2500, "speech_ms": 800,
+                "jitter": 0.25, "error_rate": 0.01},
+    "slow": {"first_token_ms": 2000, "chunk_ms": 120, "chunks": 16, "image_ms": 6000, "speech_ms": 2000,
+             "jitter": 0.5, "error_rate": 0.02},
+    "flaky": {"first_token_ms": 600, "chunk_ms": 40, "chunks": 12, "image_ms": 2500, "speech_ms": 800,
+              "jitter": 0.5, "error_rate": 0.15},
+}
+
+# Status codes Gemini returns under load, in the shape the client libraries expect
+ERRORS = [
+    (429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota)."),
+    (500, "INTERNAL", "An internal error has occurred."),
+    (503, "UNAVAILABLE", "The model is overloaded. Please try again later."),
+]
+
+ANSWER_LINES = [
+    "🍎 Here's what fits your goal:",
+    "1. 🥦 Fill half your plate with vegetables at lunch and dinner.",
+    "2. 🍗 Add a palm-sized portion of lean protein to every meal.",
+    "3. 🍚 Keep starchy carbs to about a fist-sized portion.",
+    "4. 💧 Drink water through the day, more on training days.",
+    "5. 🍰 Keep treats small and occasional rather than cutting them out.",
+    "Consistency matters more than any single meal. 💪",
+]
+IMAGE_ANSWER = ("🍛 Rice with grilled chicken and salad.\nCarbohydrates: 62 g\nFats: 14 g\n"
+                "Protein: 38 g\nCalories: 520 kcal")
+TRANSCRIPTS = [
+    "what should I eat before my workout",
+    "how much protein do I need today",
+    "is rice good for losing weight",
+    "give me a healthy snack idea",
+]
+
+app = Flask(__name__)
+config: Dict[str, Any] = dict(PROFILES["typical"], profile="typical")
+_rng = random.Random(0)
+_lock = threading.Lock()
+_stats = {"requests": {}, "errors": {}, "started_at": time.time()}
+
+
+def _count(kind: str, error: bool = False):
+    with _lock:
+        bucket = _stats["errors" if error else "requests"]
+        bucket[kind] = bucket.get(kind, 0) + 1
+
+
+def _delay(ms: float):
+    if ms <= 0:
+        return
+    with _lock:
+        factor = _rng.uniform(1 - config["jitter"], 1 + config["jitter"])
+    time.sleep(ms * factor / 1000)
+
+
+def _maybe_error(kind: str):
+    """An error response for this request according to error_rate, or None"""
+    with _lock:
+        failed = _rng.random() < config["error_rate"]
+        code, status, message = _rng.choice(ERRORS)
+    if not failed:
+        return None
+    _count(kind, error=True)
+    return jsonify({"error": {"code": code, "message": message, "status": status}}), code
+
+
+def _request_parts(body: dict):
+    """(prompt text, has image) from a generateContent request body"""
+    texts, has_image = [], False
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                texts.append(part["text"])
+            if "inlineData" in part or "inline_data" in part:
+                has_image = True
+    return "\n".join(texts), has_image
+
+
+def _answer(prompt: str, has_image: bool) -> str:
+    if has_image:
+        return IMAGE_ANSWER
+    # Deterministic per prompt, so replays produce the same answers
+    offset = int(hashlib.sha1(prompt.encode("utf-8")).hexdigest(), 16) % 3
+    return "\n".join(ANSWER_LINES[:1] + ANSWER_LINES[1 + offset:4 + offset] + ANSWER_LINES[-1:])
+
+
+def _chunks(text: str, count: int):
+    words = text.split(" ")
+    size = max(1, -(-len(words) // max(1, count)))
+    return [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "")
+            for i in range(0, len(words), size)]
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _response(text: str, prompt: str, finished: bool = True) -> dict:
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0, "safetyRatings": []}
+    if finished:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {"promptTokenCount": _tokens(prompt), "candidatesTokenCount": _tokens(text),
+                          "totalTokenCount": _tokens(prompt) + _tokens(text)},
+    }
+
+
+@app.route("/<version>/models/<path:target>", methods=["GET", "POST"])
+def models(version, target):
+    model, _, method = target.partition(":")
+    if request.method == "GET" or not method:
+        return jsonify({"name": f"models/{model}", "displayName": model, "inputTokenLimit": 1048576,
+                        "outputTokenLimit": 8192,
+                        "supportedGenerationMethods": ["generateContent", "countTokens"]})
+    body = request.get_json(silent=True) or {}
+    prompt, has_image = _request_parts(body)
+    kind = "image" if has_image else method
+    _count(kind)
+
+    if method == "countTokens":
+        return jsonify({"totalTokens": _tokens(prompt)})
+    if method not in ("generateContent", "streamGenerateContent"):
+        return jsonify({"error": {"code": 404, "message": f"Unknown method {method}", "status": "NOT_FOUND"}}), 404
+
+    error = _maybe_error(kind)
+    if error is not None:
+        _delay(config["first_token_ms"] / 2)
+        return error
+    answer = _answer(prompt, has_image)
+
+    if method == "generateContent":
+        chunks = 1 if has_image else config["chunks"]
+        _delay(config["image_ms"] if has_image else config["first_token_ms"] + config["chunk_ms"] * (chunks - 1))
+        return jsonify(_response(answer, prompt))
+
+    pieces = _chunks(answer, config["chunks"])
+    sse = request.args.get("alt") == "sse"
+
+    def stream():
+        _delay(config["image_ms"] if has_image else config["first_token_ms"])
+        if not sse:
+            yield "["
+        for i, piece in enumerate(pieces):
+            if i:
+                _delay(config["chunk_ms"])
+            payload = json.dumps(_response(piece, prompt, finished=i == len(pieces) - 1), ensure_ascii=False)
+            if sse:
+                yield f"data: {payload}\r\n\r\n"
+            else:
+                yield ("," if i else "") + payload + "\r\n"
+        if not sse:
+            yield "]"
+
+    return Response(stream(), mimetype="text/event-stream" if sse else "application/json")
+
+
+@app.route("/speech-api/v2/recognize", methods=["POST"])
+def recognize():
+    """Google speech v2: newline-separated JSON, an empty result first, then the transcript"""
+    _count("speech")
+    error = _maybe_error("speech")
+    _delay(config["speech_ms"])
+    if error is not None:
+        return "", error[1]
+    audio = request.get_data()
+    if not audio:
+        return '{"result":[]}\n'
+    transcript = TRANSCRIPTS[len(audio) % len(TRANSCRIPTS)]
+    result = {"result": [{"alternative": [{"transcript": transcript, "confidence": 0.92}], "final": True}],
+              "result_index": 0}
+    return '{"result":[]}\n' + json.dumps(result) + "\n", 200, {"Content-Type": "application/json"}
+
+
+@app.route("/mock/config", methods=["GET", "POST"])
+def mock_config():
+    """POST {"profile": "slow"} or individual fields like {"error_rate": 0.2}"""
+    if request.method == "POST":
+        update = request.get_json(silent=True) or {}
+        with _lock:
+            if update.get("profile") in PROFILES:
+                config.update(PROFILES[update["profile"]], profile=update["profile"])
+            for key, value in update.items():
+                if key in PROFILES["typical"]:
+                    config[key] = float(value) if key != "chunks" else int(value)
+    return jsonify(config)
+
+
+@app.route("/mock/stats", methods=["GET", "DELETE"])
+def mock_stats():
+    with _lock:
+        if request.method == "DELETE":
+            _stats.update(requests={}, errors={}, started_at=time.time())
+        return jsonify({**_stats, "uptime_s": round(time.time() - _stats["started_at"], 1)})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Gemini and speech APIs for load tests")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="typical")
+    parser.add_argument("--error-rate", type=float, help="override the profile's error rate (0-1)")
+    parser.add_argument("--first-token-ms", type=float, help="override the profile's time to first chunk")
+    parser.add_argument("--seed", type=int, default=0, help="seed for latency jitter and injected errors")
+    args = parser.parse_args()
+
+    config.update(PROFILES[args.profile], profile=args.profile)
+    if args.error_rate is not None:
+        config["error_rate"] = args.error_rate
+    if args.first_token_ms is not None:
+        config["first_token_ms"] = args.first_token_ms
+    _rng.seed(args.seed)
+
+    print(f"🧪 Mock Gemini + speech on http://{args.host}:{args.port} (profile {args.profile})")
+    print(f"   export GEMINI_API_ENDPOINT=http://{args.host}:{args.port}")
+    print(f"   export SPEECH_API_URL=http://{args.host}:{args.port}/speech-api/v2/recognize")
+    app.run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,242 @@
+"""
+Recompute nutrition for every user in one vectorized pass.
+
+The formulas mirror db.calculate_bmr / calculate_tdee / adjust_calories_for_goal /
+calculate_macros operation for operation in float64, and rows the vector path
+can't represent (non-numeric inputs) go through db.compute_nutrition, so the
+results are identical to the per-user path. Run `python nutrition_bulk.py --verify`
+to check that against the live data.
+"""
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import db
+from db import ACTIVITY_FACTORS, MACRO_SPLITS
+
+INPUT_FIELDS = ["weight", "height", "age", "gender", "activity_level", "goal", "surplus"]
+MISSING_DATA = "Please provide all required data (weight, height, age, gender, activity level, goal)"
+
+
+def profiles_frame(users: Dict[str, dict]) -> pd.DataFrame:
+    """One row per user with the nutrition inputs, indexed by user_id."""
+    docs = list(users.values())
+    columns = {field: [data.get(field) for data in docs] for field in INPUT_FIELDS}
+    # compute_nutrition defaults a missing surplus the same way
+    columns["surplus"] = [data.get("surplus", 400) for data in docs]
+    # object dtype keeps None/"" as they are instead of turning them into NaN
+    return pd.DataFrame(columns, index=pd.Index(list(users), name="user_id"), columns=INPUT_FIELDS, dtype=object)
+
+
+_NUMBER_TYPES = {int, float, np.int64, np.float64}
+
+
+def _of_type(column: pd.Series, types) -> np.ndarray:
+    # Exact type match: bools and numeric strings are left to the scalar path
+    return column.map(type).isin(types).to_numpy(dtype=bool)
+
+
+def compute_bulk(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Vectorized compute_nutrition. Returns BMR, TDEE, Goal Calories, Goal,
+    protein_g, carbs_g, fat_g and error (None when the row is valid).
+    """
+    n = len(frame)
+    out = pd.DataFrame(index=frame.index)
+    if n == 0:
+        return out.reindex(columns=["BMR", "TDEE", "Goal Calories", "Goal", "protein_g", "carbs_g",
+                                    "fat_g", "error", "fallback"])
+    error = np.full(n, None, dtype=object)
+
+    # compute_nutrition rejects falsy required fields before anything else
+    required = frame[["weight", "height", "age", "gender", "activity_level", "goal"]]
+    present = required.apply(lambda col: col.map(bool)).all(axis=1).to_numpy(dtype=bool)
+    error[~present] = MISSING_DATA
+
+    numeric = (_of_type(frame["weight"], _NUMBER_TYPES) & _of_type(frame["height"], _NUMBER_TYPES)
+               & _of_type(frame["age"], _NUMBER_TYPES) & _of_type(frame["surplus"], _NUMBER_TYPES))
+    strings = (_of_type(frame["gender"], {str}) & _of_type(frame["activity_level"], {str})
+               & _of_type(frame["goal"], {str}))
+    vector_rows = present & numeric & strings
+    fallback_rows = present & ~vector_rows
+
+    def column(name, fill):
+        return frame[name].where(vector_rows, fill).to_numpy(dtype=np.float64)
+
+    weight = column("weight", 0.0)
+    height = column("height", 0.0)
+    age = column("age", 0.0)
+    surplus = column("surplus", 400.0)
+    gender = frame["gender"].where(vector_rows, "").astype(str).str.lower().to_numpy()
+    activity = frame["activity_level"].where(vector_rows, "").astype(str).to_numpy()
+    goal_raw = frame["goal"].where(vector_rows, "").astype(str).to_numpy()
+    goal = np.char.lower(goal_raw.astype(str))
+
+    # Same checks, in the same order, with the same messages as db.validate_inputs
+    checks = [
+        (~((30 <= weight) & (weight <= 300)), "Weight must be between 30kg and 300kg"),
+        (~((120 <= height) & (height <= 250)), "Height must be between 120cm and 250cm"),
+        (~((15 <= age) & (age <= 90)), "Age must be between 15 and 90 years"),
+        (~np.isin(gender, ["male", "female"]), "Gender must be 'male' or 'female'"),
+        (~np.isin(activity, list(ACTIVITY_FACTORS)), "Invalid activity level"),
+        (~np.isin(goal, list(MACRO_SPLITS)), "Invalid goal"),
+        ((goal == "gain") & ~((300 <= surplus) & (surplus <= 500)),
+         "For muscle gain, surplus must be between 300 and 500 kcal"),
+    ]
+    valid = vector_rows.copy()
+    for failed, message in checks:
+        hit = valid & failed
+        error[hit] = message
+        valid &= ~hit
+
+    bmr = np.where(gender == "male",
+                   (10 * weight) + (6.25 * height) - (5 * age) + 5,
+                   (10 * weight) + (6.25 * height) - (5 * age) - 161)
+    factor = np.array([ACTIVITY_FACTORS.get(a, np.nan) for a in activity], dtype=np.float64)
+    tdee = bmr * factor
+    goal_calories = np.select([goal == "loss", goal == "gain"], [tdee - 500, tdee + surplus], default=tdee)
+    splits = np.array([MACRO_SPLITS.get(g, MACRO_SPLITS["maintenance"]) for g in goal], dtype=np.float64).reshape(-1, 3)
+
+    # np.round rounds half to even, like Python's round()
+    with np.errstate(invalid="ignore"):
+        out["BMR"] = np.round(bmr)
+        out["TDEE"] = np.round(tdee)
+        out["Goal Calories"] = np.round(goal_calories)
+        out["protein_g"] = np.round((goal_calories * splits[:, 0]) / 4)
+        out["carbs_g"] = np.round((goal_calories * splits[:, 1]) / 4)
+        out["fat_g"] = np.round((goal_calories * splits[:, 2]) / 9)
+    out["Goal"] = [str(g).capitalize() for g in goal_raw]
+    out["error"] = pd.Series(error, index=frame.index, dtype=object)
+
+    # Odd inputs (numeric strings, bools, ...) take the scalar path so they
+    # fail or succeed exactly as they would for a single user
+    fallback = np.full(n, None, dtype=object)
+    for i in np.flatnonzero(fallback_rows):
+        try:
+            fallback[i] = db.compute_nutrition(frame.iloc[i].to_dict())
+        except Exception as e:
+            fallback[i] = str(e)
+    out["fallback"] = pd.Series(fallback, index=frame.index, dtype=object)
+    return out
+
+
+def _results(out: pd.DataFrame) -> Dict[str, Any]:
+    """user_id -> nutrition dict (as compute_nutrition returns it) or an error string"""
+    columns = {name: out[name].tolist() for name in ("Goal", "error", "fallback")}
+    for name in ("BMR", "TDEE", "Goal Calories", "protein_g", "carbs_g", "fat_g"):
+        # NaN only appears on rows that carry an error
+        columns[name] = np.nan_to_num(out[name].to_numpy(dtype=np.float64)).astype(np.int64).tolist()
+    results = {}
+    for i, user_id in enumerate(out.index):
+        if columns["fallback"][i] is not None:
+            results[user_id] = columns["fallback"][i]
+        elif columns["error"][i] is not None:
+            results[user_id] = columns["error"][i]
+        else:
+            results[user_id] = {
+                "BMR": columns["BMR"][i],
+                "TDEE": columns["TDEE"][i],
+                "Goal Calories": columns["Goal Calories"][i],
+                "Goal": columns["Goal"][i],
+                "Macros": {
+                    "protein_g": columns["protein_g"][i],
+                    "carbs_g": columns["carbs_g"][i],
+                    "fat_g": columns["fat_g"][i],
+                },
+            }
+    return results
+
+
+def compute_all(users: Dict[str, dict]) -> Dict[str, Any]:
+    return _results(compute_bulk(profiles_frame(users)))
+
+
+def _inputs(data: dict) -> tuple:
+    return tuple(data.get(field, 400 if field == "surplus" else None) for field in INPUT_FIELDS)
+
+
+def recompute_all(dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Recompute every user's nutrition and write back only the ones that changed,
+    as one batch. A profile edited between the read and the write is
+    recomputed with the scalar path inside its update instead of being
+    overwritten with a stale result.
+    """
+    started = time.perf_counter()
+    users = db.load_all_users()
+    loaded = time.perf_counter()
+    results = compute_all(users)
+    computed = time.perf_counter()
+
+    mutations = {}
+    for user_id, result in results.items():
+        user = users[user_id]
+        if not isinstance(result, dict):
+            continue
+        if user.get("nutrition") == result and user.get("nutrition_fingerprint") == db.nutrition_fingerprint(user):
+            continue
+        inputs = _inputs(user)
+
+        def apply(data, result=result, inputs=inputs):
+            if _inputs(data) != inputs:
+                result = db.compute_nutrition(data)
+                if not isinstance(result, dict):
+                    return False
+            fingerprint = db.nutrition_fingerprint(data)
+            if data.get("nutrition") == result and data.get("nutrition_fingerprint") == fingerprint:
+                return False
+            data["nutrition"] = result
+            data["nutrition_fingerprint"] = fingerprint
+
+        mutations[user_id] = apply
+
+    written = 0 if dry_run else db.update_many_user_data(mutations)
+    finished = time.perf_counter()
+    return {
+        "users": len(users),
+        "valid": sum(1 for r in results.values() if isinstance(r, dict)),
+        "invalid": sum(1 for r in results.values() if not isinstance(r, dict)),
+        "changed": len(mutations),
+        "written": written,
+        "dry_run": dry_run,
+        "load_ms": round((loaded - started) * 1000, 1),
+        "compute_ms": round((computed - loaded) * 1000, 1),
+        "write_ms": round((finished - computed) * 1000, 1),
+    }
+
+
+def verify(users: Optional[Dict[str, dict]] = None) -> List[str]:
+    """user_ids whose bulk result differs from db.compute_nutrition (should be empty)"""
+    users = db.load_all_users() if users is None else users
+    bulk = compute_all(users)
+    mismatches = []
+    for user_id, data in users.items():
+        try:
+            expected = db.compute_nutrition(data)
+        except Exception as e:  # e.g. a numeric field stored as a string
+            expected = str(e)
+        if bulk[user_id] != expected:
+            mismatches.append(user_id)
+    return mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Recompute nutrition for all users in one pass")
+    parser.add_argument("--dry-run", action="store_true", help="compute and report, don't write")
+    parser.add_argument("--verify", action="store_true", help="compare against the per-user calculation")
+    args = parser.parse_args()
+
+    if args.verify:
+        mismatches = verify()
+        if mismatches:
+            print(f"❌ {len(mismatches)} users differ from the scalar calculation: {', '.join(mismatches[:20])}")
+            raise SystemExit(1)
+        print("✅ Bulk results match the scalar calculation for every user")
+    else:
+        summary = recompute_all(dry_run=args.dry_run)
+        print(f"{summary['users']} users ({summary['invalid']} with incomplete or invalid data): "
+              f"{summary['changed']} changed, {summary['written']} written "
+              f"[load {summary['load_ms']} ms, compute {summary['compute_ms']} ms, write {summary['write_ms']} ms]")
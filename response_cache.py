@@ -0,0 +1,156 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from conversation_memory import SUMMARY_KEY
+
+logger = logging.getLogger(__name__)
+
+# Questions that lean on the previous turn ("what about for dinner?",
+# "is that healthy?") can't be answered from another user's cached reply
+_FOLLOW_UP_RE = re.compile(
+    r"\b(it|its|it's|that|this|those|these|them|they|same|more|less|instead|also|else|again|above|previous|"
+    r"what about|how about|and if|then)\b"
+)
+
+
+def facts_hash(user_data: Dict[str, Any]) -> str:
+    """Hash of what the user told us about themselves (allergies, diets); "" when nothing"""
+    facts = (user_data.get(SUMMARY_KEY) or {}).get("facts") or []
+    if not facts:
+        return ""
+    return hashlib.sha1("\n".join(sorted(f.lower() for f in facts)).encode("utf-8")).hexdigest()
+
+
+def profile_bucket(user_data: Dict[str, Any], calorie_band: int = 250) -> Tuple[str, str, int, str]:
+    """
+    Coarse profile key: goal, activity level, goal calories rounded to
+    `calorie_band` and the user's stated facts, which are part of the prompt.
+    """
+    nutrition = user_data.get("nutrition") or {}
+    calories = nutrition.get("Goal Calories") or 0
+    return (
+        str(user_data.get("goal") or "").lower(),
+        str(user_data.get("activity_level") or "").lower(),
+        int(round(calories / calorie_band)) * calorie_band if calories else 0,
+        facts_hash(user_data),
+    )
+
+
+def context_hash(food_context: str) -> str:
+    return hashlib.sha1((food_context or "").encode("utf-8")).hexdigest()
+
+
+def is_follow_up(question: str, recent_chats: List[Dict[str, Any]]) -> bool:
+    """True when the answer probably depends on the recent conversation."""
+    if not recent_chats:
+        return False
+    text = (question or "").lower()
+    return len(text.split()) <= 3 or bool(_FOLLOW_UP_RE.search(text))
+
+
+@dataclass
+class _Entry:
+    vector: np.ndarray
+    key: Tuple
+    response: str
+    expires_at: float
+
+
+class SemanticResponseCache:
+    """
+    LLM answer cache matched on question similarity within a (profile bucket,
+    retrieved-context hash) key. Entries expire after `ttl_seconds` and the
+    least recently used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, threshold: float = 0.92, max_entries: int = 2048, ttl_seconds: float = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_key: Dict[Tuple, List[int]] = defaultdict(list)
+        self._next_id = 0
+        self._stats = {"hits": 0, "misses": 0, "bypasses": 0, "stores": 0, "evictions": 0}
+        self._hit_similarities: List[float] = []
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is not None:
+            ids = self._by_key.get(entry.key)
+            if ids is not None:
+                ids.remove(entry_id)
+                if not ids:
+                    del self._by_key[entry.key]
+
+    def lookup(self, query_vector, bucket: Tuple, ctx_hash: str) -> Optional[str]:
+        key = (bucket, ctx_hash)
+        query = self._normalize(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            for entry_id in [i for i in self._by_key.get(key, []) if self._entries[i].expires_at <= now]:
+                self._drop(entry_id)
+            ids = self._by_key.get(key)
+            if not ids:
+                self._stats["misses"] += 1
+                return None
+            similarities = np.stack([self._entries[i].vector for i in ids]) @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self._stats["misses"] += 1
+                return None
+            entry_id = ids[best]
+            self._entries.move_to_end(entry_id)
+            self._stats["hits"] += 1
+            self._hit_similarities.append(float(similarities[best]))
+            del self._hit_similarities[:-1000]
+            logger.info(f"Response cache hit (similarity {similarities[best]:.3f})")
+            return self._entries[entry_id].response
+
+    def store(self, query_vector, bucket: Tuple, ctx_hash: str, response: str):
+        key = (bucket, ctx_hash)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(self._normalize(query_vector), key, response,
+                                             time.monotonic() + self.ttl_seconds)
+            self._by_key[key].append(entry_id)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self._stats["bypasses"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_key.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            similarities = list(self._hit_similarities)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats["threshold"] = self.threshold
+        # Lets us see how close hits are to the threshold when tuning it
+        stats["min_hit_similarity"] = min(similarities) if similarities else None
+        return stats
@@ -2,14 +2,19 @@ import json
 from typing import Optional, Any, Dict, List
 
 from db import (
+    get_chats,
     get_user_file_path,
     load_user_data,
 )
 
-def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
-    """Retrieve essential profile information for the chatbot context."""
+def get_user_profile(user_id: str, data: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Retrieve essential profile information for the chatbot context.
+    Pass an already loaded user document as `data` to avoid another read.
+    """
     try:
-        data = load_user_data(user_id)
+        if data is None:
+            data = load_user_data(user_id, include_chats=False)
         if not data:
             return None
         return {
@@ -27,10 +32,11 @@ def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
         return None
 
 
-def get_user_nutrition(user_id: str) -> Optional[Dict[str, Any]]:
+def get_user_nutrition(user_id: str, data: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
     """Retrieve nutrition calculations (BMR, TDEE, Goal Calories, Macros)."""
     try:
-        data = load_user_data(user_id)
+        if data is None:
+            data = load_user_data(user_id, include_chats=False)
         if not data:
             return None
         return data.get("nutrition", {})
@@ -45,13 +51,9 @@ def get_user_chats(user_id: str, limit: Optional[int] = None) -> List[Dict[str,
     If limit is provided, return only the last `limit` chats.
     """
     try:
-        data = load_user_data(user_id)
-        if not data:
-            return []
-        chats = data.get("chats", [])
         if limit is not None and limit > 0:
-            return chats[-limit:]
-        return chats
+            return get_chats(user_id, limit)
+        return get_chats(user_id)
     except (json.JSONDecodeError, FileNotFoundError) as e:
         print(f"[ERROR] Failed to get chats for {user_id}: {e}")
         return []
@@ -60,7 +62,7 @@ def get_user_chats(user_id: str, limit: Optional[int] = None) -> List[Dict[str,
 def get_user_field(user_id: str, field: str) -> Optional[Any]:
     """Retrieve a single field (e.g., 'weight', 'goal')."""
     try:
-        data = load_user_data(user_id)
+        data = load_user_data(user_id, include_chats=(field == "chats"))
         if not data:
             return None
         return data.get(field)
@@ -70,10 +72,11 @@ def get_user_field(user_id: str, field: str) -> Optional[Any]:
 
 
 def build_chatbot_context(user_id: str, chat_limit: int = 5) -> Dict[str, Any]:
-    """Build a full context dictionary for the chatbot."""
-    profile = get_user_profile(user_id) or {}
-    nutrition = get_user_nutrition(user_id) or {}
-    chats = get_user_chats(user_id, chat_limit)
+    """Build a full context dictionary for the chatbot from a single user-file read."""
+    data = load_user_data(user_id, include_chats=False) or {}
+    profile = (get_user_profile(user_id, data) if data else None) or {}
+    nutrition = (get_user_nutrition(user_id, data) if data else None) or {}
+    chats = get_user_chats(user_id, chat_limit) if data else []
 
     return {
         "profile": profile,
@@ -0,0 +1,100 @@
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Shared by every request; stages are mostly I/O (Gemini, disk, speech API)
+STAGE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "16"))
+_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="chat-stage")
+
+
+class StageError(Exception):
+    """A required stage failed or ran past its timeout"""
+
+    def __init__(self, name: str, reason: str):
+        super().__init__(f"{name} {reason}")
+        self.name = name
+        self.reason = reason
+
+
+class StageRunner:
+    """
+    Runs the independent stages of one chat request concurrently on the shared
+    pool. Each stage gets its own deadline, counted from when it was started;
+    `result` turns a failure or timeout into a default for optional stages and
+    a StageError for required ones, so one slow branch can't sink the others.
+    A timed-out stage keeps its worker until it returns, it is just no longer
+    waited for.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor = None):
+        self._executor = executor or _executor
+        self._stages: Dict[str, Tuple[Future, float]] = {}
+        self._background = set()
+        self.timings: Dict[str, float] = {}
+
+    def start(self, name: str, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Future:
+        def run():
+            began = time.perf_counter()
+            try:
+                with metrics.span(name):
+                    return fn(*args, **kwargs)
+            finally:
+                self.timings[name] = (time.perf_counter() - began) * 1000
+
+        deadline = time.monotonic() + timeout if timeout else float("inf")
+        # The stage sees the request's context (e.g. its metrics trace) on the worker thread
+        future = self._executor.submit(contextvars.copy_context().run, run)
+        self._stages[name] = (future, deadline)
+        return future
+
+    def start_background(self, name: str, fn: Callable, *args, **kwargs) -> Future:
+        """
+        start() for a stage nobody calls result() on, such as persisting what the
+        request produced; a failure is logged instead of lost, and cancel_all()
+        leaves it to run.
+        """
+        future = self.start(name, fn, *args, **kwargs)
+        self._background.add(name)
+
+        def log_failure(done: Future):
+            if not done.cancelled() and done.exception() is not None:
+                logger.error(f"Background stage {name} failed: {str(done.exception())}")
+
+        future.add_done_callback(log_failure)
+        return future
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._stages
+
+    def result(self, name: str, default: Any = None, required: bool = False) -> Any:
+        if name not in self._stages:
+            return default
+        future, deadline = self._stages[name]
+        remaining = None if deadline == float("inf") else max(0.0, deadline - time.monotonic())
+        try:
+            return future.result(timeout=remaining)
+        except TimeoutError:
+            reason = "timed out"
+            metrics.STAGE_TIMEOUTS.inc(name)
+        except Exception as e:
+            reason = f"failed: {str(e)}"
+        logger.warning(f"Stage {name} {reason}")
+        if required:
+            raise StageError(name, reason)
+        return default
+
+    def cancel_all(self):
+        """Drop stages that haven't started yet, e.g. when the request ends early"""
+        for name, (future, _) in self._stages.items():
+            if name not in self._background:
+                future.cancel()
+
+    def summary(self) -> str:
+        return ", ".join(f"{name}={ms:.0f}ms" for name, ms in sorted(self.timings.items()))
@@ -0,0 +1,298 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# ===============================
+# Storage interface behind db.py
+# ===============================
+class UserStorage(ABC):
+    """
+    Backend for the user store. db.py keeps its public functions and forwards
+    to the configured storage; the JSON files are used when none is set.
+    """
+
+    @abstractmethod
+    def create_user_file(self, user_id: str, name: str, **fields) -> str:
+        pass
+
+    @abstractmethod
+    def get_user_file_path(self, user_id: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def load_user_data(self, user_id: str, include_chats: bool = True) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def save_user_data(self, user_id: str, data: dict) -> bool:
+        pass
+
+    @abstractmethod
+    def update_user_data(self, user_id: str, mutate: Callable[[dict], Optional[bool]]) -> Optional[dict]:
+        """Atomic read-modify-write; `mutate` returns False to skip the write"""
+        pass
+
+    @abstractmethod
+    def add_chat(self, user_id: str, user_message: str, bot_response: str):
+        pass
+
+    @abstractmethod
+    def get_chats(self, user_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def rename_user_file(self, user_id: str, new_name: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def list_user_ids(self) -> List[str]:
+        pass
+
+    def load_all_users(self) -> Dict[str, dict]:
+        """Every user document (without chats), keyed by user_id"""
+        users = {}
+        for user_id in self.list_user_ids():
+            data = self.load_user_data(user_id, include_chats=False)
+            if data is not None:
+                users[user_id] = data
+        return users
+
+    def update_many(self, mutations: Dict[str, Callable[[dict], Optional[bool]]]) -> int:
+        """update_user_data for several users; returns how many documents were written"""
+        written = 0
+        for user_id, mutate in mutations.items():
+            wrote = []
+
+            def apply(data, mutate=mutate):
+                wrote.append(mutate(data) is not False)
+                return wrote[-1]
+
+            self.update_user_data(user_id, apply)
+            written += sum(wrote)
+        return written
+
+
+# ===============================
+# SQLite backend
+# ===============================
+class SQLiteStorage(UserStorage):
+    """
+    User store in a single SQLite database in WAL mode, so several server
+    workers can read and write concurrently without corrupting anything.
+    The user document is kept as JSON (minus chats); chats get their own
+    table indexed on (user_id, timestamp).
+    """
+
+    def __init__(self, db_path: str = os.path.join("data", "users.db")):
+        self.db_path = db_path
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # One connection per thread, reused for every call on that thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        with self.conn:
+            self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                user_message TEXT NOT NULL,
+                bot_response TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                FOREIGN KEY(user_id) REFERENCES users(user_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_chats_user_ts ON chats(user_id, timestamp);
+            """)
+
+    @staticmethod
+    def _path(user_id: str) -> str:
+        return f"sqlite:{user_id}"
+
+    def create_user_file(self, user_id: str, name: str, **fields) -> str:
+        data = {
+            "user_id": user_id,
+            "name": name,
+            "age": fields.get("age"),
+            "weight": fields.get("weight"),
+            "height": fields.get("height"),
+            "goal": fields.get("goal"),
+            "activity_level": fields.get("activity_level"),
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "language": "en",
+            "nutrition": {}
+        }
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO users (user_id, name, data, created_at) VALUES (?, ?, ?, ?)",
+                (user_id, name, json.dumps(data, ensure_ascii=False), data["created_at"])
+            )
+        return self._path(user_id)
+
+    def get_user_file_path(self, user_id: str) -> Optional[str]:
+        row = self.conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return self._path(user_id) if row else None
+
+    def load_user_data(self, user_id: str, include_chats: bool = True) -> Optional[dict]:
+        row = self.conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if not row:
+            return None
+        data = json.loads(row[0])
+        if include_chats:
+            data["chats"] = self.get_chats(user_id)
+        return data
+
+    def save_user_data(self, user_id: str, data: dict) -> bool:
+        data = {k: v for k, v in data.items() if k != "chats"}
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE users SET name = ?, data = ? WHERE user_id = ?",
+                (data.get("name") or "unknown", json.dumps(data, ensure_ascii=False), user_id)
+            )
+        return cursor.rowcount > 0
+
+    def update_user_data(self, user_id: str, mutate: Callable[[dict], Optional[bool]]) -> Optional[dict]:
+        conn = self.conn
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent
+        # read-modify-writes from other workers queue up instead of racing
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            if not row:
+                conn.rollback()
+                return None
+            data = json.loads(row[0])
+            if mutate(data) is not False:
+                data.pop("chats", None)
+                conn.execute("UPDATE users SET name = ?, data = ? WHERE user_id = ?",
+                             (data.get("name") or "unknown", json.dumps(data, ensure_ascii=False), user_id))
+            conn.commit()
+            return data
+        except Exception:
+            conn.rollback()
+            raise
+
+    def load_all_users(self) -> Dict[str, dict]:
+        return {user_id: json.loads(data) for user_id, data in self.conn.execute("SELECT user_id, data FROM users")}
+
+    def update_many(self, mutations: Dict[str, Callable[[dict], Optional[bool]]]) -> int:
+        """All read-modify-writes in one IMMEDIATE transaction and one executemany"""
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = []
+            for user_id, mutate in mutations.items():
+                row = conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+                if not row:
+                    continue
+                data = json.loads(row[0])
+                if mutate(data) is not False:
+                    data.pop("chats", None)
+                    rows.append((data.get("name") or "unknown", json.dumps(data, ensure_ascii=False), user_id))
+            conn.executemany("UPDATE users SET name = ?, data = ? WHERE user_id = ?", rows)
+            conn.commit()
+            return len(rows)
+        except Exception:
+            conn.rollback()
+            raise
+
+    def add_chat(self, user_id: str, user_message: str, bot_response: str):
+        if self.get_user_file_path(user_id) is None:
+            self.create_user_file(user_id, "unknown")
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO chats (user_id, user_message, bot_response, timestamp) VALUES (?, ?, ?, ?)",
+                (user_id, user_message, bot_response, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+
+    def get_chats(self, user_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        if limit:
+            rows = self.conn.execute(
+                "SELECT user_message, bot_response, timestamp FROM chats WHERE user_id = ? "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?", (user_id, limit)
+            ).fetchall()
+            rows.reverse()
+        else:
+            rows = self.conn.execute(
+                "SELECT user_message, bot_response, timestamp FROM chats WHERE user_id = ? "
+                "ORDER BY timestamp, id", (user_id,)
+            ).fetchall()
+        return [{"user": u, "bot": b, "timestamp": t} for u, b, t in rows]
+
+    def rename_user_file(self, user_id: str, new_name: str) -> Optional[str]:
+        data = self.load_user_data(user_id, include_chats=False)
+        if data is None:
+            return None
+        data["name"] = new_name
+        self.save_user_data(user_id, data)
+        return self._path(user_id)
+
+    def list_user_ids(self) -> List[str]:
+        return [row[0] for row in self.conn.execute("SELECT user_id FROM users ORDER BY user_id")]
+
+    def import_user(self, data: dict, chats: List[Dict[str, Any]]) -> bool:
+        """Insert a user and their chats in one transaction; existing users are left alone"""
+        user_id = data["user_id"]
+        doc = {k: v for k, v in data.items() if k != "chats"}
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO users (user_id, name, data, created_at) VALUES (?, ?, ?, ?)",
+                (user_id, doc.get("name") or "unknown", json.dumps(doc, ensure_ascii=False),
+                 doc.get("created_at") or datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            if cursor.rowcount == 0:
+                return False
+            self.conn.executemany(
+                "INSERT INTO chats (user_id, user_message, bot_response, timestamp) VALUES (?, ?, ?, ?)",
+                [(user_id, c.get("user", ""), c.get("bot", ""), c.get("timestamp", "")) for c in chats]
+            )
+        return True
+
+
+def migrate_json_to_sqlite(storage: SQLiteStorage, users_dir: str = os.path.join("data", "users")) -> Dict[str, int]:
+    """
+    One-shot import of data/users/*.json (and their .chats.jsonl logs) into SQLite.
+    Users that already exist in the database are skipped, so it is safe to re-run.
+    """
+    from db import _read_chat_lines  # db imports this module; skips a torn last log line
+    imported, skipped, chats = 0, 0, 0
+    for path in sorted(glob.glob(os.path.join(users_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not data.get("user_id"):
+            continue
+        user_chats = list(data.get("chats", []))
+        log_path = os.path.splitext(path)[0] + ".chats.jsonl"
+        if os.path.exists(log_path):
+            with open(log_path, "r", encoding="utf-8") as f:
+                user_chats = _read_chat_lines(f)
+        if storage.import_user(data, user_chats):
+            imported += 1
+            chats += len(user_chats)
+        else:
+            skipped += 1
+    return {"imported": imported, "skipped": skipped, "chats": chats}
+
@@ -0,0 +1,38 @@
+import pytest
+
+from food_facts import FoodTable, answer_food_fact, detect_food_fact_intent
+
+
+@pytest.fixture(scope="module")
+def table():
+    return FoodTable.from_csv()
+
+
+@pytest.mark.parametrize("question, food", [
+    ("how many calories in cream cheese", "Cream Cheese"),
+    ("protein in cheddar cheese", "Cheddar Cheese"),
+    ("calories in chedar cheese", "Cheddar Cheese"),
+    ("nutrition facts for fried rice", "Fried Rice"),
+])
+def test_direct_lookups_are_answered(table, question, food):
+    answer = answer_food_fact(question, table)
+    assert answer is not None and food in answer
+
+
+@pytest.mark.parametrize("question", [
+    "calories in cream cheese bagel",
+    "how much fat in a bagel with cream cheese",
+    "protein in ricotta cheese vs cream cheese",
+    "calories in cream cheese or butter",
+    "calories in cream cheese compared to butter",
+    "calories in cream cheese if i am on keto",
+    "calories in cheese",
+])
+def test_partial_comparison_and_conditional_questions_go_to_the_llm(table, question):
+    assert answer_food_fact(question, table) is None
+
+
+def test_intent_keeps_only_requested_nutrients():
+    intent = detect_food_fact_intent("protein and fat in cheddar cheese")
+    assert intent.food == "cheddar cheese"
+    assert intent.nutrients == ["Protein", "Fat"]
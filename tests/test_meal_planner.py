@@ -0,0 +1,42 @@
+import pytest
+
+import meal_planner
+from food_facts import FoodTable
+from meal_planner import MealPlanner
+
+TARGETS = {"calories": 2200, "protein_g": 165, "carbs_g": 220, "fat_g": 73}
+
+
+@pytest.fixture(scope="module")
+def planner():
+    return MealPlanner(FoodTable.from_csv())
+
+
+@pytest.fixture(params=["linprog", "greedy"])
+def solver(request, monkeypatch):
+    if request.param == "greedy":
+        monkeypatch.setattr(meal_planner, "_linprog", None)
+    elif meal_planner.get_linprog() is None:
+        pytest.skip("scipy is not installed")
+    return request.param
+
+
+@pytest.mark.parametrize("max_items", [1, 3, 5, 8])
+def test_plan_respects_max_items(planner, solver, max_items):
+    plan = planner.plan(TARGETS, max_items=max_items)
+    assert plan.solver == solver
+    assert 0 < len(plan.items) <= max_items
+
+
+def test_preferred_foods_do_not_raise_max_items(planner, solver):
+    plan = planner.plan(TARGETS, prefer=["rice", "egg", "oatmeal", "chicken"], max_items=2)
+    assert len(plan.items) <= 2
+
+
+def test_no_meat_excludes_cold_cuts(planner):
+    plan = planner.plan(TARGETS, exclude=["meat"], max_items=20)
+    excluded = planner._excluded_rows(["meat"])
+    for name in ("sandwich with cold cuts", "pepperoni pizza", "ham cheese sandwich", "spaghetti with meatballs"):
+        assert excluded[planner.names.index(name)]
+    for item in plan.items:
+        assert not any(word in item["food"] for word in ("ham", "salami", "pepperoni", "cold cut", "bologna"))
@@ -0,0 +1,184 @@
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+
+@dataclass
+class SearchResult:
+    documents: List[str]
+    metadata: List[Dict[str, Any]]
+    scores: Optional[List[float]] = None
+
+
+def _matches(metadata: Dict[str, Any], filters: Optional[Dict[str, Any]]) -> bool:
+    """Subset of Chroma's `where` syntax: plain equality, $eq and $and"""
+    if not filters:
+        return True
+    for key, expected in filters.items():
+        if key == "$and":
+            if not all(_matches(metadata, f) for f in expected):
+                return False
+        elif isinstance(expected, dict) and "$eq" in expected:
+            if metadata.get(key) != expected["$eq"]:
+                return False
+        elif metadata.get(key) != expected:
+            return False
+    return True
+
+
+class _Rows(NamedTuple):
+    """Everything a search reads, replaced as a whole so readers never see a half-applied write"""
+    matrix: Optional[np.ndarray]
+    documents: List[Any]
+    metadata: List[Dict[str, Any]]
+    ids: List[str]
+
+
+_EMPTY = _Rows(None, [], [], [])
+
+
+class NumpyVectorStore:
+    """
+    Exact in-process nearest-neighbour search over an L2-normalized float32 matrix.
+
+    A query is one matrix-vector product plus argpartition, which for the food
+    catalog (hundreds to a few thousand rows) is well under a millisecond.
+    It implements both the RAG.ChromaVectorStore interface (add_documents /
+    search) and the LangChain calls used by chatbot.retrieve_relevant_data
+    (from_documents / similarity_search). Scores are cosine distances
+    (1 - cosine similarity), so lower is better as with Chroma.
+
+    Writes build new arrays and swap them in together under a lock, so it is
+    safe to update (e.g. from RAG.IndexSync) while other threads search.
+    """
+
+    def __init__(self, embedding=None):
+        self.embedding = embedding
+        self._rows = _EMPTY
+        self._write_lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def __len__(self):
+        return len(self._rows.documents)
+
+    @staticmethod
+    def _without(rows: _Rows, ids) -> _Rows:
+        doomed = set(ids)
+        keep = [i for i, id_ in enumerate(rows.ids) if id_ not in doomed]
+        if len(keep) == len(rows.ids):
+            return rows
+        return _Rows(rows.matrix[keep] if keep else None, [rows.documents[i] for i in keep],
+                     [rows.metadata[i] for i in keep], [rows.ids[i] for i in keep])
+
+    @staticmethod
+    def _with(rows: _Rows, documents, vectors: np.ndarray, metadata, ids) -> _Rows:
+        matrix = vectors if rows.matrix is None else np.vstack([rows.matrix, vectors])
+        return _Rows(matrix, rows.documents + list(documents), rows.metadata + list(metadata),
+                     rows.ids + list(ids))
+
+    def add_documents(self, documents: List[Any], embeddings: List[List[float]],
+                      metadata: List[Dict[str, Any]], ids: List[str]):
+        """Add documents to the vector store"""
+        if not documents:
+            return
+        vectors = self._normalize(embeddings)
+        with self._write_lock:
+            self._rows = self._with(self._rows, documents, vectors, metadata, ids)
+
+    def delete(self, ids: List[str]):
+        """Drop the documents with these ids"""
+        with self._write_lock:
+            self._rows = self._without(self._rows, ids)
+
+    def upsert(self, documents: List[Any], embeddings: List[List[float]],
+               metadata: List[Dict[str, Any]], ids: List[str]):
+        """add_documents(), replacing documents that already have one of the ids"""
+        vectors = self._normalize(embeddings) if documents else None
+        with self._write_lock:
+            rows = self._without(self._rows, ids)
+            self._rows = self._with(rows, documents, vectors, metadata, ids) if documents else rows
+
+    def metadata_values(self, key: str, where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """id -> stored `key` metadata for the documents matching `where`"""
+        rows = self._rows
+        return {id_: meta.get(key) for id_, meta in zip(rows.ids, rows.metadata) if _matches(meta, where)}
+
+    def fingerprints(self, where: Optional[Dict[str, Any]] = None) -> Dict[str, Optional[str]]:
+        """id -> stored "fingerprint" metadata for the documents matching `where`"""
+        return self.metadata_values("fingerprint", where)
+
+    @staticmethod
+    def _top_k(rows: _Rows, query_matrix: np.ndarray, top_k: int, filters: Optional[Dict[str, Any]]):
+        if rows.matrix is None or top_k <= 0:
+            return [([], []) for _ in range(len(query_matrix))]
+        similarities = query_matrix @ rows.matrix.T
+        if filters:
+            allowed = np.array([_matches(m, filters) for m in rows.metadata])
+            similarities[:, ~allowed] = -np.inf
+            candidates = int(allowed.sum())
+        else:
+            candidates = similarities.shape[1]
+        k = min(top_k, candidates)
+        if k == 0:
+            return [([], []) for _ in range(len(query_matrix))]
+        if k < similarities.shape[1]:
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(similarities.shape[1]), (len(similarities), 1))
+        rows = np.arange(len(similarities))[:, None]
+        order = np.argsort(-similarities[rows, top], axis=1)
+        top = top[rows, order][:, :k]
+        return [(indices.tolist(), similarities[i, indices].tolist()) for i, indices in enumerate(top)]
+
+    def search_batch(self, query_embeddings: List[List[float]], top_k: int = 5,
+                     filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        """Search for several queries with a single matrix product"""
+        if len(query_embeddings) == 0:
+            return []
+        rows = self._rows  # one consistent snapshot for the whole search
+        results = []
+        for indices, similarities in self._top_k(rows, self._normalize(query_embeddings), top_k, filters):
+            results.append(SearchResult(
+                documents=[rows.documents[i] for i in indices],
+                metadata=[rows.metadata[i] for i in indices],
+                scores=[1.0 - s for s in similarities]
+            ))
+        return results
+
+    def search(self, query_embedding: List[float], top_k: int = 5,
+               filters: Optional[Dict[str, Any]] = None) -> SearchResult:
+        """Search for similar documents"""
+        return self.search_batch([query_embedding], top_k, filters)[0]
+
+    # LangChain-style API used by chatbot.py
+
+    @classmethod
+    def from_documents(cls, documents, embedding, **kwargs) -> "NumpyVectorStore":
+        store = cls(embedding)
+        vectors = embedding.embed_documents([doc.page_content for doc in documents])
+        store.add_documents(list(documents), vectors,
+                            [doc.metadata for doc in documents],
+                            [str(i) for i in range(len(documents))])
+        return store
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Any]:
+        return self.search(embedding, top_k=k, filters=kwargs.get("filter")).documents
+
+    def similarity_search_by_vectors(self, embeddings: List[List[float]], k: int = 4, **kwargs) -> List[List[Any]]:
+        return [r.documents for r in self.search_batch(embeddings, top_k=k, filters=kwargs.get("filter"))]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Any]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def delete_collection(self):
+        """No-op: the store is in memory and requests may still hold it after a reload"""